@@ -0,0 +1,368 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from first_order import Relation, Var
+from mente_parser import program, parse_statement, make_horn_kb
+from propositional import PackedKB, WatchIndex
+from sat import Solver
+from prover import Prover, preprocess
+from predicate import Predicate, Budget, solve
+from primitives import Literal, HornClause, HornKB, And, KB, FreeClause, Clause
+import visitor
+from datalog import Datalog
+from tests import pigeonhole_kb
+from visitor import ImplicationsVisitor, CanonicalizeVisitor, GlobalizeVisitor, SkolemVisitor, SimplifyVisitor, \
+    DistributeVisitor, ClausifyVisitor, NormalizeVisitor, CNFVisitor, DefinitionsVisitor, GroundVisitor, VarVisitor, \
+    FreeVarVisitor, VariantVisitor, RenameVisitor, SubstVisitor, NameSupply, conjuncts
+
+
+def connected_facts(n, stations=1000, lines=10):
+    """`n` distinct `connected/3` facts over a fixed set of stations and lines"""
+    connected = Relation("connected")
+
+    return [connected(Literal(f"station_{i % stations}"),
+                      Literal(f"station_{(i % stations + i // stations + 1) % stations}"),
+                      Literal(f"line_{i % lines}"))
+            for i in range(n)]
+
+
+def bench_terms(n=200000):
+    """Memory per fact and construction throughput of terms"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    facts = connected_facts(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"terms: {(after - before) / n:.1f} bytes per fact")
+    del facts
+
+    start = time.perf_counter()
+    facts = connected_facts(n)
+    elapsed = time.perf_counter() - start
+    print(f"terms: {n / elapsed:.0f} facts/s construction")
+
+    connected = Relation("connected")
+    start = time.perf_counter()
+    clauses = [HornClause({fact, ~connected(Var("X"), fact.vars[0], Var("L"))}) for fact in facts]
+    elapsed = time.perf_counter() - start
+    print(f"terms: {len(clauses) / elapsed:.0f} clauses/s construction")
+
+
+def bench_load(sizes=(1000, 10000, 100000)):
+    """Loading time of fact tables into a `HornKB`"""
+    for n in sizes:
+        facts = connected_facts(n)
+
+        start = time.perf_counter()
+        HornKB.from_iterable(HornClause({fact}) for fact in facts)
+        elapsed = time.perf_counter() - start
+        print(f"load: {n} facts in {elapsed:.3f}s ({n / elapsed:.0f} facts/s)")
+
+
+def connected_program(n, stations=1000, lines=10):
+    """Source of a Prolog-like program with `n` `connected/3` facts and a few rules over them"""
+    facts = [f"connected(station_{i % stations}, station_{(i % stations + i // stations + 1) % stations}, "
+             f"line_{i % lines})." for i in range(n)]
+    rules = ["nearby(X, Y) :- connected(X, Y, L).",
+             "nearby(X, Y) :- connected(X, Z, L), connected(Z, Y, L).",
+             "reachable(X, Y, []) :- connected(X, Y, L).",
+             "reachable(X, Y, [Z, R]) :- connected(X, Z, L), reachable(Z, Y, R)."]
+
+    return "\n".join(facts + rules)
+
+
+def bench_compile(n=150):
+    """Compilation of a parsed program to a `HornKB`: `Predicate.propositionalize` against `make_horn_kb`"""
+    statements = program.parseString(connected_program(n), parseAll=True)["statements"]
+
+    start = time.perf_counter()
+    formulas = [parse_statement(statement) for statement in statements]
+    formula = formulas[-1]
+    for clause in reversed(formulas[:-1]):
+        formula = And(clause, formula)
+    clauses = Predicate(formula).propositionalize().components
+    HornKB.from_iterable(HornClause.from_clause(clause) for clause in clauses)
+    elapsed = time.perf_counter() - start
+    print(f"compile: propositionalize {len(statements)} statements in {elapsed:.3f}s")
+
+    start = time.perf_counter()
+    make_horn_kb(statements)
+    elapsed = time.perf_counter() - start
+    print(f"compile: make_horn_kb {len(statements)} statements in {elapsed:.3f}s")
+
+
+def _timed(stages, formula):
+    """Runs `formula` through `stages` (pairs of name and function), printing the time taken by each"""
+    total = 0
+    for name, stage in stages:
+        start = time.perf_counter()
+        formula = stage(formula)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        print(f"propositionalize:   {name:<12} {elapsed:.3f}s")
+
+    return formula, total
+
+
+def bench_propositionalize(n=20000):
+    """Per-stage and total time of the seven-pass CNF pipeline against the fused `NormalizeVisitor` and `CNFVisitor`"""
+    statements = program.parseString(connected_program(n), parseAll=True)["statements"]
+    formula = KB._make_and(conjuncts([parse_statement(statement) for statement in statements]))
+
+    print(f"propositionalize: seven passes over {len(statements)} statements")
+    clauses, total = _timed([("implications", ImplicationsVisitor().visit),
+                             ("canonicalize", CanonicalizeVisitor().visit),
+                             ("globalize", lambda f: GlobalizeVisitor(NameSupply().reserve(f)).visit(f)),
+                             ("skolem", SkolemVisitor().visit),
+                             ("simplify", lambda f: FreeClause([SimplifyVisitor().visit(f)])),
+                             ("distribute", DistributeVisitor().visit),
+                             ("clausify", lambda f: ClausifyVisitor().visit(f).clauses)], formula)
+    print(f"propositionalize:   {'total':<12} {total:.3f}s ({len(clauses)} clauses)")
+
+    print(f"propositionalize: fused passes over {len(statements)} statements")
+    clauses, total = _timed([("normalize", lambda f: NormalizeVisitor(NameSupply().reserve(f)).visit(f)),
+                             ("cnf", lambda f: KB.from_iterable(Clause(terms) for terms in CNFVisitor().visit(f)).clauses)],
+                            formula)
+    print(f"propositionalize:   {'total':<12} {total:.3f}s ({len(clauses)} clauses)")
+
+
+def _count_visits(visit, formula):
+    """Number of `visit` calls made while visiting `formula`"""
+    visits = 0
+
+    def profile(frame, event, _):
+        nonlocal visits
+        if event == "call" and frame.f_code is visitor._visitor_impl.__code__:
+            visits += 1
+
+    sys.setprofile(profile)
+    try:
+        visit(formula)
+    finally:
+        sys.setprofile(None)
+
+    return visits
+
+
+def bench_visitors(n=2000, repeat=5):
+    """Visits per second of each visitor class, each one on the formula it gets in the CNF pipeline"""
+    statements = program.parseString(connected_program(n), parseAll=True)["statements"]
+    formula = KB._make_and(conjuncts([parse_statement(statement) for statement in statements]))
+    implications = ImplicationsVisitor().visit(formula)
+    canonical = CanonicalizeVisitor().visit(implications)
+    global_ = GlobalizeVisitor().visit(canonical)
+    skolem = SkolemVisitor().visit(global_)
+    simple = FreeClause([SimplifyVisitor().visit(skolem)])
+    distributed = DistributeVisitor().visit(simple)
+    normal = NormalizeVisitor().visit(formula)
+    relations = FreeClause([term for terms in CNFVisitor().visit(normal) for term in terms])
+    names = {Var("X"): Var("Y"), Var("Y"): Var("X")}
+
+    cases = [("GroundVisitor", lambda: GroundVisitor().visit, implications),
+             ("VarVisitor", lambda: VarVisitor().visit, implications),
+             ("FreeVarVisitor", lambda: FreeVarVisitor().visit, normal),
+             ("ImplicationsVisitor", lambda: ImplicationsVisitor().visit, formula),
+             ("CanonicalizeVisitor", lambda: CanonicalizeVisitor().visit, implications),
+             ("GlobalizeVisitor", lambda: GlobalizeVisitor().visit, canonical),
+             ("SkolemVisitor", lambda: SkolemVisitor().visit, global_),
+             ("SimplifyVisitor", lambda: SimplifyVisitor().visit, skolem),
+             ("DistributeVisitor", lambda: DistributeVisitor().visit, simple),
+             ("ClausifyVisitor", lambda: ClausifyVisitor().visit, distributed),
+             ("NormalizeVisitor", lambda: NormalizeVisitor().visit, formula),
+             ("CNFVisitor", lambda: CNFVisitor().visit, normal),
+             ("DefinitionsVisitor", lambda: lambda f: list(DefinitionsVisitor().clauses(f)), normal),
+             ("SubstVisitor", lambda: SubstVisitor(Var("X"), Literal("a")).visit, normal),
+             ("VariantVisitor", lambda: lambda f: [VariantVisitor().visit(term) for term in f.terms], relations),
+             ("RenameVisitor", lambda: lambda f: [RenameVisitor(names).visit(term) for term in f.terms], relations)]
+
+    for name, make, formula in cases:
+        visits = _count_visits(make(), formula)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            make()(formula)
+        elapsed = time.perf_counter() - start
+        print(f"visitors: {name:<20} {visits * repeat / elapsed:>10.0f} visits/s")
+
+
+def chain_kb(n):
+    """`HornKB` of a chain of `n` `next/2` facts, with a right-recursive `path/2` over it"""
+    next_, path = Relation("next"), Relation("path")
+    x, y, z = Var("X"), Var("Y"), Var("Z")
+    clauses = [HornClause({next_(Literal(f"s{i}"), Literal(f"s{i + 1}"))}) for i in range(n)]
+    clauses += [HornClause({path(x, y), ~next_(x, z), ~path(z, y)}, body=[~next_(x, z), ~path(z, y)]),
+                HornClause({path(x, y), ~next_(x, y)})]
+
+    return HornKB(clauses)
+
+
+def bench_depth(sizes=(1000, 10000, 100000)):
+    """Time to prove `path(s0, s<n>)` over a chain of `n` facts: a proof `n` levels deep"""
+    path = Relation("path")
+    for n in sizes:
+        kb = chain_kb(n)
+        query = HornClause({path(Literal("s0"), Literal(f"s{n}"))})
+
+        start = time.perf_counter()
+        solve(kb, query)
+        elapsed = time.perf_counter() - start
+        print(f"depth: {n} levels in {elapsed:.3f}s ({n / elapsed:.0f} levels/s)")
+
+
+def bench_datalog(stations=200, n=400):
+    """Bottom-up materialization of the transitive closure of `n` `connected/3` facts"""
+    connected, reachable = Relation("connected"), Relation("reachable")
+    x, y, z, line = Var("X"), Var("Y"), Var("Z"), Var("L")
+    clauses = [HornClause({fact}) for fact in connected_facts(n, stations)]
+    clauses += [HornClause({reachable(x, y), ~connected(x, y, line)}),
+                HornClause({reachable(x, y), ~reachable(x, z), ~connected(z, y, line)},
+                           body=[~reachable(x, z), ~connected(z, y, line)])]
+    kb = HornKB(clauses)
+
+    start = time.perf_counter()
+    model = Datalog(kb)
+    elapsed = time.perf_counter() - start
+    print(f"datalog: {len(model)} facts materialized in {elapsed:.3f}s ({len(model) / elapsed:.0f} facts/s)")
+
+
+def random_horn_kb(n, atoms, body=3, facts=0.01, seed=0):
+    """`HornKB` of `n` random propositional Horn clauses over `atoms` atoms: a fraction `facts` of them are facts,
+    the others have up to `body` literals in the body"""
+    rng = random.Random(seed)
+    literals = [Literal(f"p{i}") for i in range(atoms)]
+    clauses = []
+    for _ in range(n):
+        head = rng.choice(literals)
+        if rng.random() < facts:
+            clauses.append(HornClause({head}))
+        else:
+            clauses.append(HornClause({head} | {~rng.choice(literals) for _ in range(rng.randint(1, body))}))
+
+    return HornKB(clauses)
+
+
+def bench_forward_chaining(n=1000000, atoms=200000, queries=10):
+    """Forward chaining over a random Horn KB of `n` clauses: index construction, then entailment checks"""
+    kb = random_horn_kb(n, atoms)
+
+    start = time.perf_counter()
+    packed = PackedKB.from_kb(kb)
+    elapsed = time.perf_counter() - start
+    print(f"forward chaining: packing of {n} clauses in {elapsed:.3f}s")
+
+    start = time.perf_counter()
+    index = WatchIndex(packed)
+    elapsed = time.perf_counter() - start
+    print(f"forward chaining: index of {n} clauses in {elapsed:.3f}s")
+
+    start = time.perf_counter()
+    inferred = index.inferred()
+    elapsed = time.perf_counter() - start
+    print(f"forward chaining: closure ({sum(inferred)} atoms) in {elapsed:.3f}s ({n / elapsed:.0f} clauses/s)")
+
+    literals = [Literal(f"p{i}") for i in random.Random(1).sample(range(atoms), queries)]
+    start = time.perf_counter()
+    for literal in literals:
+        index.entails(literal)
+    elapsed = time.perf_counter() - start
+    print(f"forward chaining: {queries} queries in {elapsed:.3f}s ({elapsed / queries * 1000:.1f}ms per query)")
+
+
+def random_cnf(variables, ratio=4.26, width=3, seed=0):
+    """`KB` of random `width`-literal clauses, `ratio` clauses per variable (4.26 is the hardest for 3-SAT)"""
+    rng = random.Random(seed)
+    atoms = [Literal(f"x{i}") for i in range(variables)]
+
+    return KB([Clause({atom if rng.random() < 0.5 else ~atom for atom in rng.sample(atoms, width)})
+               for _ in range(int(ratio * variables))])
+
+
+def bench_sat(sizes=(100, 125, 150), instances=5):
+    """Time and conflicts per second of the CDCL solver on random 3-SAT at the phase transition"""
+    for n in sizes:
+        conflicts = satisfiable = 0
+        elapsed = 0
+        for seed in range(instances):
+            solver = Solver(random_cnf(n, seed=seed))
+
+            start = time.perf_counter()
+            satisfiable += solver.solve()
+            elapsed += time.perf_counter() - start
+            conflicts += solver.conflicts
+
+        print(f"sat: {instances} instances of {n} variables ({satisfiable} satisfiable) in {elapsed:.3f}s "
+              f"({conflicts / elapsed:.0f} conflicts/s)")
+
+
+def bench_prover(sizes=(3, 4), chain=200):
+    """Inferences per second of the resolution prover: refuting pigeonhole KBs, and a non-Horn chain
+    (`p(X) ∨ q(X)`, each implying the next stage) over `chain` stages"""
+    for holes in sizes:
+        prover = Prover(pigeonhole_kb(holes).clauses, Budget())
+
+        start = time.perf_counter()
+        prover.saturate()
+        elapsed = time.perf_counter() - start
+        print(f"prover: pigeonhole with {holes} holes in {elapsed:.3f}s "
+              f"({prover.budget.steps / elapsed:.0f} inferences/s)")
+
+    p, q, x = Relation("p"), Relation("q"), Var("X")
+    stages = [Relation(f"stage_{i}") for i in range(chain + 1)]
+    clauses = [Clause({p(x), q(x)})] + [Clause({~p(x), stages[0](x)}), Clause({~q(x), stages[0](x)})]
+    clauses += [Clause({~stages[i](x), stages[i + 1](x)}) for i in range(chain)]
+    prover = Prover(clauses, Budget())
+    prover.add([~stages[chain](Literal("a"))])
+
+    start = time.perf_counter()
+    prover.saturate()
+    elapsed = time.perf_counter() - start
+    print(f"prover: chain of {chain} stages in {elapsed:.3f}s ({prover.budget.steps / elapsed:.0f} inferences/s)")
+
+
+def bench_preprocess(n=2000, variables=2000):
+    """Redundant clauses removed, and time taken, by `preprocess` on a propositionalized program and on a random
+    KB of 1 to 4 literal clauses"""
+    statements = program.parseString(connected_program(n), parseAll=True)["statements"]
+    formula = KB._make_and(conjuncts([parse_statement(statement) for statement in statements]))
+    rng = random.Random(0)
+    atoms = [Literal(f"x{i}") for i in range(variables)]
+    cases = [("propositionalized", Predicate(formula).propositionalize()),
+             ("random", KB([Clause({atom if rng.random() < 0.5 else ~atom
+                                    for atom in rng.choices(atoms, k=rng.randint(1, 4))})
+                            for _ in range(10 * variables)]))]
+
+    for name, kb in cases:
+        size = len(kb.components if isinstance(kb, Predicate) else kb.clauses)
+
+        start = time.perf_counter()
+        _, removed = preprocess(kb)
+        elapsed = time.perf_counter() - start
+        print(f"preprocess: {name} {size} clauses in {elapsed:.3f}s ({removed.tautologies} tautologies, "
+              f"{removed.duplicates} duplicates, {removed.subsumed} subsumed)")
+
+
+BENCHMARKS = {
+    "terms": bench_terms,
+    "load": bench_load,
+    "compile": bench_compile,
+    "propositionalize": bench_propositionalize,
+    "visitors": bench_visitors,
+    "depth": bench_depth,
+    "datalog": bench_datalog,
+    "forward_chaining": bench_forward_chaining,
+    "sat": bench_sat,
+    "prover": bench_prover,
+    "preprocess": bench_preprocess,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
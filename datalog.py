@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from first_order import Var, RelationInstance
+from primitives import Literal, HornKB
+
+
+def _arguments(atom):
+    return atom.vars if type(atom) is RelationInstance else ()
+
+
+def _make_atom(functor, args):
+    name, arity = functor
+    return RelationInstance(name, *args) if arity else Literal(name)
+
+
+class _Rule:
+    """A Datalog rule, with its body atoms as `(functor, arguments)` pairs (arguments are `Var`s or constants)"""
+
+    def __init__(self, clause):
+        self.head = (clause.head.functor(), _arguments(clause.head))
+        self.body = [((~term).functor(), _arguments(~term)) for term in clause.body]
+
+        body_vars = {arg for _, args in self.body for arg in args if type(arg) is Var}
+        if any(type(arg) is Var and arg not in body_vars for arg in self.head[1]):
+            raise TypeError(f"unsafe Datalog rule (head variables must occur in the body): {clause}")
+
+
+class Datalog:
+    """Bottom-up evaluation of a function-free `HornKB`: the least model of the KB is materialized once,
+    with semi-naive iteration (each round only joins rules against the facts derived in the previous round),
+    and queries are then answered from it. Body atoms are joined through hash indexes on their bound arguments."""
+
+    def __init__(self, kb: HornKB):
+        # Facts of the model, as tuples of arguments by functor
+        self.relations = defaultdict(set)
+        # Hash indexes: (functor, bound positions) -> values of those positions -> facts
+        self.indexes = {}
+        self.rules = []
+
+        delta = defaultdict(set)
+        for clause in kb.clauses:
+            for term in clause.terms:
+                if any(type(arg) not in [Var, Literal] for arg in _arguments(term)):
+                    raise TypeError(f"Datalog clauses must be function-free: {clause}")
+
+            if clause.body:
+                self.rules.append(_Rule(clause))
+            elif any(type(arg) is Var for arg in _arguments(clause.head)):
+                raise TypeError(f"Datalog facts must be ground: {clause}")
+            else:
+                delta[clause.head.functor()].add(_arguments(clause.head))
+
+        for functor, facts in delta.items():
+            self._add(functor, facts)
+
+        while delta:
+            delta = self._round(delta)
+
+    def __contains__(self, fact):
+        return _arguments(fact) in self.relations.get(fact.functor(), ())
+
+    def __len__(self):
+        return sum(len(facts) for facts in self.relations.values())
+
+    def query(self, goal):
+        """Generator of the facts of the model that match `goal`"""
+        args = _arguments(goal)
+        for binding in self._join(goal.functor(), args, {}):
+            yield _make_atom(goal.functor(), tuple(binding[arg] if type(arg) is Var else arg for arg in args))
+
+    def _round(self, delta):
+        """Facts derived from `delta` (the facts new in the previous round) that are not in the model yet"""
+        derived = defaultdict(set)
+
+        for rule in self.rules:
+            head_functor, head_args = rule.head
+
+            for i, (functor, args) in enumerate(rule.body):
+                if functor not in delta:
+                    continue
+
+                # Start from the new facts of the i-th atom, then join the others against the whole model
+                bindings = [binding for fact in delta[functor] for binding in self._unify(args, fact, {})]
+                for j, (other_functor, other_args) in enumerate(rule.body):
+                    if j != i:
+                        bindings = [new_binding for binding in bindings
+                                    for new_binding in self._join(other_functor, other_args, binding)]
+
+                for binding in bindings:
+                    fact = tuple(binding[arg] if type(arg) is Var else arg for arg in head_args)
+                    if fact not in self.relations[head_functor]:
+                        derived[head_functor].add(fact)
+
+        for functor, facts in derived.items():
+            self._add(functor, facts)
+
+        return derived
+
+    def _join(self, functor, args, binding):
+        """Extensions of `binding` that match `args` against a fact of `functor`"""
+        facts = self.relations.get(functor, ())
+        for fact in self._match(functor, args, binding, facts):
+            yield from self._unify(args, fact, binding)
+
+    def _match(self, functor, args, binding, facts):
+        """Facts that agree with the arguments of `args` bound by `binding` (or constant), via a hash index"""
+        positions = []
+        values = []
+        for position, arg in enumerate(args):
+            if type(arg) is not Var:
+                positions.append(position)
+                values.append(arg)
+            elif arg in binding:
+                positions.append(position)
+                values.append(binding[arg])
+
+        if not positions:
+            return facts
+
+        return self._index(functor, tuple(positions)).get(tuple(values), ())
+
+    def _index(self, functor, positions):
+        index = self.indexes.get((functor, positions))
+        if index is None:
+            index = defaultdict(list)
+            for fact in self.relations.get(functor, ()):
+                index[tuple(fact[position] for position in positions)].append(fact)
+            self.indexes[(functor, positions)] = index
+
+        return index
+
+    def _add(self, functor, facts):
+        self.relations[functor].update(facts)
+
+        for (indexed, positions), index in self.indexes.items():
+            if indexed == functor:
+                for fact in facts:
+                    index[tuple(fact[position] for position in positions)].append(fact)
+
+    @staticmethod
+    def _unify(args, fact, binding):
+        """`binding` extended so that `args` match `fact` (nothing if they can't)"""
+        new_binding = binding
+        for arg, value in zip(args, fact):
+            if type(arg) is Var:
+                bound = new_binding.get(arg)
+                if bound is None:
+                    if new_binding is binding:
+                        new_binding = dict(binding)
+                    new_binding[arg] = value
+                elif bound != value:
+                    return
+            elif arg != value:
+                return
+
+        yield new_binding
+
+
+def datalog_solve(knowledge_base: HornKB, query) -> list:
+    """Facts entailed by `knowledge_base` (function-free) that match `query`, by bottom-up evaluation"""
+    return list(Datalog(knowledge_base).query(query))
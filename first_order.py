@@ -1,6 +1,7 @@
 from dataclasses import dataclass
+from functools import partial
 
-from primitives import Literal, Clause, Term, FreeClause
+from primitives import Literal, Clause, Term, FreeClause, Interned
 
 
 @dataclass
@@ -11,14 +12,20 @@ class Relation:
         return RelationInstance(self.name, *args)
 
 
-class RelationInstance(Term):
+class RelationInstance(Term, metaclass=Interned):
     relation_name: str
-    vars: list
+    vars: tuple
+    __slots__ = ("relation_name", "vars", "_hash")
 
     def __init__(self, relation_name: str, *vars, negate: bool = False):
         super().__init__(negate)
         object.__setattr__(self, "relation_name", relation_name)
         object.__setattr__(self, "vars", vars)
+        object.__setattr__(self, "_hash", hash(("RelationInstance", relation_name, vars, negate)))
+
+    @staticmethod
+    def _key(relation_name: str, *vars, negate: bool = False):
+        return relation_name, vars, negate
 
     def __contains__(self, item):
         present = False
@@ -43,14 +50,18 @@ class RelationInstance(Term):
     def __invert__(self):
         return RelationInstance(self.relation_name, *self.vars, negate=not self.negate)
 
+    def __reduce__(self):
+        # Copies and unpickled terms go through the constructor, so they are interned too
+        return partial(RelationInstance, negate=self.negate), (self.relation_name, *self.vars)
+
     def __eq__(self, other):
-        return type(other) is RelationInstance and \
-               self.relation_name == other.relation_name and \
-               self.vars == other.vars and \
-               self.negate == other.negate
+        return self is other
 
     def __hash__(self):
-        return hash(self.relation_name) ^ hash(self.negate) ^ hash("RelationName") ^ hash(self.vars)
+        return self._hash
+
+    def functor(self):
+        return self.relation_name, len(self.vars)
 
 
 @dataclass
@@ -64,12 +75,18 @@ class Function:
         return FunctionInstance(self.name, args[0])
 
 
-class Var(Term):
+class Var(Term, metaclass=Interned):
     name: str
+    __slots__ = ("name", "_hash")
 
     def __init__(self, name: str, negate: bool = False):
         super().__init__(negate)
         object.__setattr__(self, "name", name)
+        object.__setattr__(self, "_hash", hash(("Var", name)))
+
+    @staticmethod
+    def _key(name: str, negate: bool = False):
+        return (name, True) if negate else name
 
     def __repr__(self):
         return f"Var{{name={self.name}, negate={self.negate}}}"
@@ -78,10 +95,11 @@ class Var(Term):
         return f"{self.name}"
 
     def __eq__(self, other):
-        return type(other) is Var and self.name == other.name
+        # Polarity doesn't matter for variables
+        return self is other or (type(other) is Var and self.name == other.name)
 
     def __hash__(self):
-        return hash(self.name) ^ hash(self.negate) ^ hash("Var")
+        return self._hash
 
     def __contains__(self, item):
         return type(item) is Var and self.name == item.name
@@ -89,15 +107,24 @@ class Var(Term):
     def __invert__(self):
         return Var(self.name, not self.negate)
 
+    def __reduce__(self):
+        return Var, (self.name, self.negate)
+
 
-class FunctionInstance(Term):
+class FunctionInstance(Term, metaclass=Interned):
     function_name: str
     arg: Term
+    __slots__ = ("function_name", "arg", "_hash")
 
     def __init__(self, function_name, arg, negate=False):
         super().__init__(negate)
         object.__setattr__(self, "function_name", function_name)
         object.__setattr__(self, "arg", arg)
+        object.__setattr__(self, "_hash", hash(("FunctionInstance", function_name, arg, negate)))
+
+    @staticmethod
+    def _key(function_name, arg, negate=False):
+        return function_name, arg, negate
 
     def __str__(self):
         string = ""
@@ -116,18 +143,22 @@ class FunctionInstance(Term):
     def __invert__(self):
         return FunctionInstance(self.function_name, self.arg, not self.negate)
 
+    def __reduce__(self):
+        return FunctionInstance, (self.function_name, self.arg, self.negate)
+
     def __eq__(self, other):
-        return type(other) is FunctionInstance and \
-               self.function_name == other.function_name and \
-               self.arg == other.arg and \
-               self.negate == other.negate
+        return self is other
 
     def __hash__(self):
-        return hash(self.function_name) ^ hash(self.negate) ^ hash("FunctionInstance") ^ hash(self.arg)
+        return self._hash
+
+    def functor(self):
+        return self.function_name, 1
 
 
 @dataclass(init=False, frozen=True)
 class Quantifier(Term):
+    __slots__ = ("variable", "predicate")
     variable: Var
     predicate: FreeClause
 
@@ -145,8 +176,13 @@ class Quantifier(Term):
     def __contains__(self, item):
         return item in self.predicate
 
+    def __reduce__(self):
+        return type(self), (self.variable, self.predicate, self.negate)
+
 
 class Exists(Quantifier):
+    __slots__ = ()
+
     def __str__(self):
         string = "("
 
@@ -160,6 +196,8 @@ class Exists(Quantifier):
 
 
 class ForAll(Quantifier):
+    __slots__ = ()
+
     def __str__(self):
         string = "("
 
@@ -1,37 +1,22 @@
 import sys
 import unittest
 
-from mente_parser import program, clause as clause_parser, parse_statement
-from predicate import Predicate, solve
-from primitives import HornKB, HornClause, And
-from tests import PropositionalLogicTestCase
+from mente_parser import program, clause as clause_parser, parse_statement, make_horn_kb
+from predicate import solve
+import tests
 
 
 def main():
     path = input("input file: ")
     parser = program.parseFile(path, parseAll=True)
 
-    superclause = []
     statements = parser.get("statements", [])
 
     if not statements:
         print("Empty input file. Exiting...")
         return
 
-    for statement in parser["statements"]:
-        superclause += [parse_statement(statement)]
-
-    # Generate free clause with and of elements in superclause
-    clause_iter = reversed(superclause)
-    free_clause = next(clause_iter)
-
-    for clause in clause_iter:
-        free_clause = And(clause, free_clause)
-
-    p = Predicate(free_clause).propositionalize()
-    hkb = HornKB(())
-    for clause in p.components:
-        hkb += HornClause.from_clause(clause)
+    hkb = make_horn_kb(statements)
 
     query_input = input("input query: ") + "."
     query = parse_statement(clause_parser.parseString(query_input)["clause"])
@@ -46,9 +31,7 @@ def main():
 
 
 def run_tests():
-    suite = unittest.TestSuite()
-    suite.addTest(PropositionalLogicTestCase('test_clause_contains'))
-    suite.addTest(PropositionalLogicTestCase('test_clause_remove'))
+    suite = unittest.defaultTestLoader.loadTestsFromModule(tests)
 
     runner = unittest.TextTestRunner(verbosity=2)
     runner.run(suite)
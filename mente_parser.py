@@ -1,8 +1,8 @@
 from pyparsing import Word, alphanums, delimitedList, Group, Optional, cStyleComment, ZeroOrMore, Forward, nestedExpr
 
 from first_order import Var, Relation, Exists
-from primitives import Literal as Lit, FreeClause, Implies, And, HornClause
-from visitor import FreeVarVisitor
+from primitives import Literal as Lit, FreeClause, Implies, And, HornClause, HornKB
+from visitor import FreeVarVisitor, RenameVisitor
 
 upper = alphanums.upper() + "_"
 lower = alphanums.lower() + "_"
@@ -118,6 +118,32 @@ def make_clause(head_parse, body_parse):
     return FreeClause([clause])
 
 
+def make_horn_clause(statement_parse, index):
+    """Turns a parsed statement (`head :- body.` or a fact) straight into a `HornClause`, without going through
+    `Predicate.propositionalize`. Variables are renamed apart from the ones of every other statement,
+    `index` being the position of the statement in the program"""
+    head_parse = statement_parse["head"]
+    if "constant" in head_parse:
+        head = make_fact(head_parse["constant"])
+    else:
+        head = make_relation(head_parse["relation"])
+
+    body = [make_body_term(term) for term in statement_parse.get("body", [])]
+
+    vars_visitor = FreeVarVisitor()
+    vars = vars_visitor.visit(head) + [var for term in body for var in vars_visitor.visit(term)]
+    rename = RenameVisitor({var: Var(f"{var.name}#{index}") for var in vars})
+
+    # The body is proved in source order
+    body = list(dict.fromkeys(~rename.visit(term) for term in body))
+    return HornClause({rename.visit(head)} | set(body), body=body)
+
+
+def make_horn_kb(statements):
+    """Compiles the parsed statements of a Prolog-like program to a `HornKB`"""
+    return HornKB.from_iterable(make_horn_clause(statement, i) for i, statement in enumerate(statements))
+
+
 def parse_relation(string):
     relation_parse = relation.parseString(string)["relation"]
     return make_relation(relation_parse)
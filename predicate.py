@@ -1,9 +1,20 @@
+import itertools
+import math
+import time
+from collections import defaultdict
 from dataclasses import dataclass
+from enum import Enum
 
 from first_order import Var, RelationInstance, FunctionInstance
-from primitives import FreeClause, HornKB, HornClause, Implies, Or
-from visitor import CanonicalizeVisitor, SubstVisitor, SkolemVisitor, GlobalizeVisitor, SimplifyVisitor, \
-    DistributeVisitor, ClausifyVisitor, ImplicationsVisitor
+from primitives import FreeClause, HornKB, HornClause, Implies, Or, Clause, Operator, And, KB
+from visitor import CanonicalizeVisitor, NameSupply, NormalizeVisitor, CNFVisitor, DefinitionsVisitor, VariantVisitor, \
+    conjuncts
+
+
+class Clausification(Enum):
+    """How `Predicate.propositionalize` turns a formula into clauses"""
+    DISTRIBUTE = "distribute"  # equivalent CNF, exponential in the worst case
+    DEFINITIONS = "definitions"  # equisatisfiable CNF with definition atoms (Plaisted-Greenbaum), linear
 
 
 @dataclass
@@ -13,144 +24,752 @@ class Predicate:
     def __str__(self):
         return str(self.components)
 
-    def propositionalize(self):
-        remove_implications = ImplicationsVisitor()
-        components = remove_implications.visit(self.components)
+    def propositionalize(self, clausification=Clausification.DISTRIBUTE):
+        """Converts the predicate to a list of clauses (CNF).
+        `components` can be a single formula or a list of formulas (taken in conjunction)"""
+        formulas = list(conjuncts(self.components))
+        if not formulas:
+            return Predicate(())
 
-        canonicalize = CanonicalizeVisitor()
-        components = canonicalize.visit(components)
+        formula = KB._make_and(formulas)
+        names = NameSupply().reserve(formula)
+        components = NormalizeVisitor(names).visit(formula)
 
-        globalize = GlobalizeVisitor()
-        components = globalize.visit(components)
+        if clausification is Clausification.DEFINITIONS:
+            clauses = DefinitionsVisitor().clauses(components)
+        else:
+            clauses = CNFVisitor().visit(components)
+        components = KB.from_iterable(Clause(terms) for terms in clauses).clauses
 
-        skolem_visitor = SkolemVisitor()
-        components = skolem_visitor.visit(components)
+        return Predicate(components)
 
-        simplify_visitor = SimplifyVisitor()
-        components = FreeClause([simplify_visitor.visit(components)])
 
-        distribute_visitor = DistributeVisitor()
-        components = distribute_visitor.visit(components)
+class OccursCheck(Enum):
+    """When `unify` checks that a variable doesn't occur in the term it gets bound to"""
+    ALWAYS = "always"
+    NEVER = "never"
+    HEADS = "heads"  # only when unifying a goal with the head of a rule
 
-        clausify_visitor = ClausifyVisitor()
-        components = clausify_visitor.visit(components).clauses
 
-        return Predicate(components)
+class Limit(Enum):
+    """Which limit of a `Budget` stopped a search"""
+    STEPS = "steps"
+    DEADLINE = "deadline"
+    CANCELLED = "cancelled"
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, limit: Limit):
+        super().__init__(f"search stopped: {limit.value} limit reached")
+        self.limit = limit
+
+
+class Budget:
+    """Resource limits of a search: at most `steps` inference steps (clauses tried against a goal),
+    until `deadline` (a `time.monotonic()` value, or `timeout` seconds from now) and until `cancel`
+    (e.g. a `threading.Event`) is set. The clock and `cancel` are only checked every `interval` steps.
+    When a limit is hit the search raises `BudgetExceeded`, and `exceeded` tells which limit it was:
+    `solve_iter` and friends stop there, and their answers so far are partial.
+    A budget is single-use: steps are never reset, so a search given a budget another search already used
+    starts with what is left of it (use a new `Budget` for every search that should get the whole of it)."""
+
+    def __init__(self, steps=None, deadline=None, timeout=None, cancel=None, interval=256):
+        if timeout is not None:
+            deadline = time.monotonic() + timeout if deadline is None else min(deadline, time.monotonic() + timeout)
+
+        self.max_steps = steps
+        self.deadline = deadline
+        self.cancel = cancel
+        self.interval = interval
+        self.steps = 0
+        self.exceeded = None
+
+    def step(self):
+        self.steps += 1
+
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.stop(Limit.STEPS)
+        if self.steps % self.interval == 0:
+            self.check()
+
+    def check(self):
+        """Checks the clock and `cancel` now, for loops that may run long between steps"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stop(Limit.DEADLINE)
+        if self.cancel is not None and self.cancel.is_set():
+            self.stop(Limit.CANCELLED)
+
+    def stop(self, limit: Limit):
+        self.exceeded = limit
+        raise BudgetExceeded(limit)
+
+
+class Bindings:
+    """Substitution store. Variables are bound in place and every binding is recorded on a trail,
+    so that bindings can be undone on backtracking by going back to a previous `mark`.
+    Bound variables can be chained (`X -> Y -> a`): `deref` follows the chain.
 
+    Clauses are renamed apart by frame instead of being copied: every activation of a clause gets a new
+    frame number, and variable `X` of the clause read in frame `n` is bound under the key `(X, n)`.
+    Values are `(term, frame)` pairs, so bound terms are shared and read in the frame they came from.
+    Frame 0 is the query's: its variables are bound under their own key.
+    `occurs_check` and `budget` (a `Budget`, if any) are the settings of the search the bindings belong to."""
 
-def unify(x, y, subst):
+    def __init__(self, occurs_check=OccursCheck.ALWAYS, budget=None):
+        self.values = {}
+        self.trail = []
+        self.frames = 0
+        self.occurs_check = occurs_check
+        self.budget = budget
+
+    def __repr__(self):
+        return f"Bindings{{values={self.values}}}"
+
+    def __contains__(self, var):
+        return var in self.values
+
+    def __getitem__(self, var):
+        return self.values[var][0]
+
+    def __len__(self):
+        return len(self.values)
+
+    def items(self):
+        return self.values.items()
+
+    def frame(self):
+        """A new frame, to rename the variables of a clause apart from every other activation"""
+        self.frames += 1
+        return self.frames
+
+    def bind(self, var, value, frame=0, value_frame=0):
+        key = var if frame == 0 else (var, frame)
+        self.values[key] = (value, value_frame)
+        self.trail.append(key)
+
+    def mark(self):
+        return len(self.trail)
+
+    def undo(self, mark):
+        while len(self.trail) > mark:
+            del self.values[self.trail.pop()]
+
+    def walk(self, term, frame=0):
+        """Follows the bindings of `term` (read in `frame`), returning the term it stands for and its frame"""
+        values = self.values
+        while type(term) is Var:
+            value = values.get(term if frame == 0 else (term, frame))
+            if value is None:
+                break
+            term, frame = value
+
+        return term, frame
+
+    def deref(self, term, frame=0):
+        return self.walk(term, frame)[0]
+
+
+def unify(x, y, subst: Bindings, head=False, x_frame=0, y_frame=0):
+    """Unifies `x` (read in `x_frame`) and `y` (read in `y_frame`) binding variables in `subst`.
+    Returns `subst` if they unify, otherwise `None` (and the bindings made while trying are undone).
+    `head` tells whether `x` is the head of a rule, for `OccursCheck.HEADS`"""
     if subst is None:
         return None
-    elif x == y:
-        return subst
-    elif type(x) is Var:
-        return unify_var(x, y, subst)
-    elif type(y) is Var:
-        return unify_var(y, x, subst)
-    elif [type(x), type(y)] == [RelationInstance, RelationInstance]:
-        return unify(x.relation_name, y.relation_name, unify(x.vars, y.vars, subst))
-    elif [type(x), type(y)] == [FunctionInstance, FunctionInstance]:
-        return unify(x.function_name, y.function_name, unify(x.arg, y.arg, subst))
-    elif [type(x), type(y)] == [list, list] and len(x) == len(y):
-        if not x:
-            return subst
-        return unify(x[0], y[0], unify(x[1:], y[1:], subst))
-    elif [type(x), type(y)] == [tuple, tuple]:
-        return unify(list(x), list(y), subst)
-    else:
-        return None
 
+    occurs_check = subst.occurs_check is OccursCheck.ALWAYS or (head and subst.occurs_check is OccursCheck.HEADS)
 
-def unify_var(var, val, subst):
-    if var == val:
+    mark = subst.mark()
+    if unify_terms(x, y, subst, occurs_check, x_frame, y_frame):
         return subst
-    elif var in subst:
-        unify(subst[var], val, subst)
-    elif type(val) is Var and val in subst:
-        unify(var, val, subst)
-    elif occurs(var, val, subst):
-        return None
-    subst = {**subst, **{var: val}}
 
-    return subst
+    subst.undo(mark)
+    return None
 
 
-def occurs(var, x, subst):
-    if var == x:
+def unify_terms(x, y, subst: Bindings, occurs_check=True, x_frame=0, y_frame=0):
+    # Pairs of terms left to unify: arguments are pushed instead of recursing into them,
+    # so unification is linear in the size of the terms and doesn't depend on their depth
+    todo = [(x, x_frame, y, y_frame)]
+    walk = subst.walk
+
+    while todo:
+        x, x_frame, y, y_frame = todo.pop()
+        x, x_frame = walk(x, x_frame)
+        y, y_frame = walk(y, y_frame)
+
+        if x is y and x_frame == y_frame:
+            continue
+        elif type(x) is Var:
+            if not unify_var(x, y, subst, occurs_check, x_frame, y_frame):
+                return False
+        elif type(y) is Var:
+            if not unify_var(y, x, subst, occurs_check, y_frame, x_frame):
+                return False
+        elif type(x) is RelationInstance and type(y) is RelationInstance:
+            if x.relation_name != y.relation_name or len(x.vars) != len(y.vars):
+                return False
+            todo.extend((x_arg, x_frame, y_arg, y_frame) for x_arg, y_arg in zip(x.vars, y.vars))
+        elif type(x) is FunctionInstance and type(y) is FunctionInstance:
+            if x.function_name != y.function_name:
+                return False
+            todo.append((x.arg, x_frame, y.arg, y_frame))
+        elif x != y:
+            return False
+
+    return True
+
+
+def unify_var(var, val, subst: Bindings, occurs_check=True, var_frame=0, val_frame=0):
+    """Binds `var` (unbound) to `val` (dereferenced)"""
+    if var == val and var_frame == val_frame:
         return True
-    elif x in subst:
-        return occurs(var, subst[x], subst)
-    elif type(x) is list:
-        return occurs(var, x[0], subst) or occurs(var, x[1:], subst)
-    return False
+    elif occurs_check and occurs(var, val, subst, var_frame, val_frame):
+        return False
 
+    subst.bind(var, val, var_frame, val_frame)
+    return True
 
-def rule_iter_for_goal(kb: HornKB, goal: HornClause):
-    done = []
-    for rule in kb:
-        done += [rule]
-        todo = [clause for clause in kb if clause not in done]
-        todo_bodies = [term for clause in todo for term in [body_term for body_term in clause.body]]
-        done_heads = [term for clause in done for term in [head for head in clause.head]]
 
-        # Unification pass
-        unified_todo_bodies = [subst_all(body_term, unify(body_term, goal, {}) or {}) for body_term in todo_bodies]
-        unified_done_heads = [subst_all(head, unify(head, goal, {}) or {}) for head in done_heads]
+def occurs(var, x, subst: Bindings, var_frame=0, x_frame=0):
+    todo = [(x, x_frame)]
 
-        head_matches = dict(zip(unified_done_heads, done))
-        body_matches = dict(zip(unified_todo_bodies, todo))
+    while todo:
+        x, frame = subst.walk(*todo.pop())
 
-        if ~goal in unified_todo_bodies and goal in unified_done_heads:
-            goal_clause = prettify(head_matches[goal])
-            offending_clause = prettify(body_matches[~goal])
-            raise RuntimeError(f"cycle detected while trying to prove {goal}.\n"
-                               f"There is at least one clause to analyze which has goal in its body (negated)\n"
-                               f"cycle: {str(goal_clause)} (current) 🡢 {str(offending_clause)} (todo) 🡢 {str(goal_clause)}\n"
-                               f"while having already analyzed a clause with goal in head\n"
-                               f"already analyzed: {[str(c) for c in done]} \ntodo: {[str(c) for c in todo]}\n")
-        yield rule
+        if type(x) is Var:
+            if x == var and frame == var_frame:
+                return True
+        elif type(x) is RelationInstance:
+            todo.extend((arg, frame) for arg in x.vars)
+        elif type(x) is FunctionInstance:
+            todo.append((x.arg, frame))
+        elif isinstance(x, Clause):
+            todo.extend((term, frame) for term in x.terms)
 
+    return False
 
-def backward_chain_query(kb: HornKB, query):
-    return backward_chain_or(kb, query.head, {})
 
+def check_cycle(kb: HornKB, goal, ancestors, subst: Bindings, frame=0, candidates=None):
+    """Raises if `goal` (read in `frame`) is being proved again while proving itself.
+    `ancestors` are the `(goal, frame)` calls of recursive predicates currently being proved, outermost first,
+    and `candidates` the positions of those that could be the same call (all of them by default).
+    Ancestors are read with the bindings of `subst` as they are now, not as they were when they were called
+    (`nat(X)` is no longer the same call as `nat(Y)` once `X = s(Y)`), and compared with `goal` as variants,
+    since each call renames the clause variables apart"""
+    if candidates is None:
+        candidates = range(len(ancestors))
+
+    for i in sorted(candidates, reverse=True):
+        ancestor, ancestor_frame = ancestors[i]
+        if _is_variant(ancestor, ancestor_frame, goal, frame, subst):
+            path = [subst_all(ancestor, subst, ancestor_frame) for ancestor, ancestor_frame in ancestors[i:]]
+            path.append(subst_all(goal, subst, frame))
+            component = kb.dependencies.component(goal.functor())
+            clauses = [prettify(clause) for clause in kb.clauses if clause.head.functor() in component]
+            raise RuntimeError(f"cycle detected while trying to prove {path[-1]}.\n"
+                               f"goal is called again while proving itself\n"
+                               f"cycle: {' 🡢 '.join(str(g) for g in path)}\n"
+                               f"recursive predicates: {[f'{name}/{arity}' for name, arity in component]}\n"
+                               f"clauses: {[str(c) for c in clauses]}\n")
+
+
+def _is_variant(x, x_frame, y, y_frame, subst: Bindings):
+    """Whether `x` (read in `x_frame`) and `y` (read in `y_frame`) are equal up to a renaming
+    of their unbound variables, with the bindings of `subst`. Stops at the first difference"""
+    renaming = {}
+    renamed = set()
+    todo = [(x, x_frame, y, y_frame)]
+    walk = subst.walk
+
+    while todo:
+        x, x_frame, y, y_frame = todo.pop()
+        x, x_frame = walk(x, x_frame)
+        y, y_frame = walk(y, y_frame)
+
+        if type(x) is Var and type(y) is Var:
+            x_key, y_key = (x, x_frame), (y, y_frame)
+            if x_key in renaming:
+                if renaming[x_key] != y_key:
+                    return False
+            elif y_key in renamed:
+                return False
+            else:
+                renaming[x_key] = y_key
+                renamed.add(y_key)
+        elif type(x) is not type(y) or type(x) is Var:
+            return False
+        elif type(x) is RelationInstance:
+            if x.functor() != y.functor():
+                return False
+            todo.extend((x_arg, x_frame, y_arg, y_frame) for x_arg, y_arg in zip(x.vars, y.vars))
+        elif type(x) is FunctionInstance:
+            if x.function_name != y.function_name:
+                return False
+            todo.append((x.arg, x_frame, y.arg, y_frame))
+        elif x != y:
+            return False
+
+    return True
+
+
+def backward_chain_query(kb: HornKB, query, tables=None, occurs_check=OccursCheck.ALWAYS, budget=None):
+    if tables is not None:
+        tables.use(kb)
 
-def backward_chain_or(kb: HornKB, goal, subst):
-    for rule in rule_iter_for_goal(kb, goal):
-        # body => head
-        # FOL-BC-AND (KB , body, UNIFY (head, goal , θ))
-        for new_subst in backward_chain_and(kb, rule.body, unify(rule.head, goal, subst)):
-            yield new_subst
+    return backward_chain_or(kb, query.head, Bindings(occurs_check, budget), tables=tables)
 
 
-def subst_all(clause, subst):
-    new_clause = clause
-    for (body, new) in subst.items():
-        subst_visitor = SubstVisitor(body, new)
-        new_clause = subst_visitor.visit(new_clause)
-    return new_clause
+def backward_chain_or(kb: HornKB, goal, subst, ancestors=(), tables=None, frame=0):
+    """Proves `goal` (read in `frame`), see `backward_chain`"""
+    return backward_chain(kb, [goal], subst, ancestors, tables, frame)
 
 
-def backward_chain_and(kb: HornKB, goals, subst):
+def backward_chain_and(kb: HornKB, goals, subst, ancestors=(), tables=None, frame=0):
+    """Proves the body `goals` of a rule (negative literals, read in `frame`), see `backward_chain`"""
     if subst is None:
-        return
-    elif len(goals) == 0:
-        yield subst
+        return iter(())
+
+    return backward_chain(kb, [~goal for goal in goals], subst, ancestors, tables, frame)
+
+
+# Closes the body of a call to a recursive predicate in a goal list, see `backward_chain`
+_EXIT = object()
+
+
+class _Choice:
+    """Choice point: the alternatives left to resolve `goal` with (clauses, or answers from a table),
+    the goals to prove after it, and the state to go back to before trying each one"""
+    __slots__ = ("goal", "frame", "goals", "alternatives", "index", "mark", "depth", "changes", "tabled")
+
+    def __init__(self, goal, frame, goals, alternatives, mark, depth, changes, tabled=False):
+        self.goal = goal
+        self.frame = frame
+        self.goals = goals
+        self.alternatives = alternatives
+        self.index = 0
+        self.mark = mark
+        self.depth = depth
+        self.changes = changes
+        self.tabled = tabled
+
+
+def _first_argument(goal, subst, frame):
+    return subst.deref(goal.vars[0], frame) if type(goal) is RelationInstance and goal.vars else None
+
+
+def _call_key(goal, first_argument, subst, frame):
+    """Key of the call to `goal` (read in `frame`) among the ancestors of a call, see `backward_chain`"""
+    variants = VariantVisitor()
+    call = variants.visit(subst_all(goal, subst, frame))
+    if not variants.names:
+        return call
+
+    return goal.functor(), None if first_argument is None else first_argument.functor()
+
+
+def backward_chain(kb: HornKB, goals, subst, ancestors=(), tables=None, frame=0):
+    """Proves `goals` (read in `frame`) left to right, yielding `subst` once for every proof.
+    Each clause a goal is resolved with gets a new frame, see `Bindings`.
+    `ancestors` are the `(goal, frame)` calls of recursive predicates already being proved, see `check_cycle`.
+
+    The search runs on an explicit goal list and choice point stack rather than on nested generators,
+    so proofs can be as deep as memory allows and every answer is yielded straight to the caller.
+    The goal list is a linked list of `(goal, frame, rest)` cells shared by the choice points:
+    a body replaces the goal it resolves, so nothing is left behind once its last goal is called
+    (last-call optimization), and a choice point is dropped when its last alternative is taken.
+    The exception are calls to recursive predicates, which are pushed on the stack of ancestors:
+    their body is followed by an `(_EXIT, depth, rest)` cell that brings the stack back to `depth`.
+    Consecutive exits are merged into one, so returning from any number of nested calls takes one step."""
+    budget = subst.budget
+    choices = []
+
+    # The calls to recursive predicates being proved are `stack[:depth]`, as `(goal, frame)`, and `positions` has
+    # their positions by `keys`: the call itself if it was ground when it was called, otherwise its functor and
+    # first argument (`None` if it was unbound). Ancestors are instantiated as the proof goes on, so a new call can be
+    # the same as those with its key, with its functor and an unbound first argument, or, if it's ground, with its
+    # functor and first argument.
+    # Overwritten entries are recorded in `changes`, to be restored on backtracking
+    stack = list(ancestors)
+    keys = [_call_key(ancestor, _first_argument(ancestor, subst, ancestor_frame), subst, ancestor_frame)
+            for ancestor, ancestor_frame in ancestors]
+    depth = len(stack)
+    positions = defaultdict(set)
+    for position, key in enumerate(keys):
+        positions[key].add(position)
+    changes = []
+
+    rest = None
+    for goal in reversed(goals):
+        rest = (goal, frame, rest)
+
+    while True:
+        if rest is None:
+            yield subst
+        else:
+            goal, frame, rest = rest
+
+            if goal is _EXIT:
+                # `frame` holds the depth to go back to
+                depth = frame
+                continue
+
+            if tables is not None and tables.is_tabled(goal):
+                resolved = [(subst_all(ancestor, subst, ancestor_frame), 0)
+                            for ancestor, ancestor_frame in stack[:depth]]
+                answers = table_answers(kb, goal, subst, resolved, tables, frame)
+                choices.append(_Choice(goal, frame, rest, answers, subst.mark(), depth, len(changes), True))
+            else:
+                first_argument = _first_argument(goal, subst, frame)
+
+                if kb.dependencies.is_recursive(goal.functor()):
+                    key = _call_key(goal, first_argument, subst, frame)
+                    related = [key]
+                    if first_argument is not None and type(first_argument) is not Var:
+                        if type(key) is not tuple:
+                            # Ground: non-ground ancestors can have been instantiated to it since they were called
+                            related.append((goal.functor(), first_argument.functor()))
+                        related.append((goal.functor(), None))
+                    candidates = [position for related_key in related for position in positions.get(related_key, ())
+                                  if position < depth]
+                    if candidates:
+                        check_cycle(kb, goal, stack[:depth], subst, frame, candidates)
+
+                    if depth < len(stack):
+                        changes.append((depth, stack[depth], keys[depth], key))
+                        positions[keys[depth]].discard(depth)
+                        stack[depth] = (goal, frame)
+                        keys[depth] = key
+                    else:
+                        changes.append((depth, None, None, key))
+                        stack.append((goal, frame))
+                        keys.append(key)
+                    positions[key].add(depth)
+
+                    if rest is not None and rest[0] is _EXIT:
+                        rest = (_EXIT, min(depth, rest[1]), rest[2])
+                    else:
+                        rest = (_EXIT, depth, rest)
+                    depth += 1
+
+                choices.append(_Choice(goal, frame, rest, kb.candidates(goal, first_argument),
+                                       subst.mark(), depth, len(changes)))
+
+        # Backtrack: resume from the next alternative of the latest choice point
+        rest = _FAILED
+        while rest is _FAILED:
+            if not choices:
+                return
+
+            choice = choices[-1]
+            subst.undo(choice.mark)
+            depth = choice.depth
+            while len(changes) > choice.changes:
+                position, old, old_key, key = changes.pop()
+                positions[key].discard(position)
+                if old is None:
+                    del stack[position:]
+                    del keys[position:]
+                else:
+                    stack[position] = old
+                    keys[position] = old_key
+                    positions[old_key].add(position)
+
+            if choice.index == len(choice.alternatives):
+                choices.pop()
+                continue
+
+            alternative = choice.alternatives[choice.index]
+            choice.index += 1
+
+            if choice.tabled:
+                # The table can still grow while it is read, so the choice point stays until it is exhausted
+                if unify(choice.goal, alternative, subst, x_frame=choice.frame, y_frame=subst.frame()) is not None:
+                    rest = choice.goals
+                continue
+
+            if choice.index == len(choice.alternatives):
+                choices.pop()
+            if budget is not None:
+                budget.step()
+
+            # body => head
+            # FOL-BC-AND (KB , body, UNIFY (head, goal , θ))
+            rule_frame = subst.frame()
+            if unify(alternative.head, choice.goal, subst, head=True, x_frame=rule_frame,
+                     y_frame=choice.frame) is not None:
+                rest = choice.goals
+                for term in reversed(alternative.body):
+                    rest = (~term, rule_frame, rest)
+
+
+_FAILED = object()
+
+
+class Tables:
+    """Answer tables for tabled resolution of the given predicates (as `(name, arity)` pairs).
+    The answers of a tabled goal are computed once per variant, iterating its clauses up to a fixpoint
+    (so left recursion terminates), and then read back by every later call, across queries on the same KB."""
+
+    def __init__(self, predicates=()):
+        self.predicates = set(predicates)
+        self.kb = None
+        self.answers = {}
+        self.complete = set()
+        self.additions = 0
+
+        # Goals being evaluated, with their depth in the evaluation stack
+        self.evaluating = {}
+        # Evaluated goals that depend on goals still being evaluated: they are complete when their leader is
+        self.incomplete = []
+        # Shallowest goal being evaluated that was called again by a goal below it
+        self.floor = math.inf
+
+    def is_tabled(self, goal):
+        return goal.functor() in self.predicates
+
+    def use(self, kb: HornKB):
+        if self.kb is not kb:
+            self.kb = kb
+            self.answers = {}
+            self.complete = set()
+
+        self.evaluating = {}
+        self.incomplete = []
+        self.floor = math.inf
+
+
+def table_answers(kb: HornKB, goal, subst, ancestors, tables: Tables, frame=0):
+    """The answers (so far) to `goal` (read in `frame`) in its table, evaluating the table first if needed"""
+    call = subst_all(goal, subst, frame)
+    key = VariantVisitor().visit(call)
+
+    if key not in tables.complete:
+        if key in tables.evaluating:
+            # Recursive call: consume the answers found so far, the fixpoint iteration will find the rest
+            tables.floor = min(tables.floor, tables.evaluating[key])
+        else:
+            evaluate_table(kb, call, key, ancestors, tables, subst.occurs_check, subst.budget)
+
+    return tables.answers[key]
+
+
+def evaluate_table(kb: HornKB, goal, key, ancestors, tables: Tables, occurs_check, budget=None):
+    answers = tables.answers.setdefault(key, [])
+    known = set(answers)
+
+    depth = len(tables.evaluating)
+    tables.evaluating[key] = depth
+    floor, tables.floor = tables.floor, math.inf
+    incomplete = len(tables.incomplete)
+
+    additions = None
+    while additions != tables.additions:
+        additions = tables.additions
+        if budget is not None:
+            budget.check()
+
+        for rule in kb.candidates(goal):
+            if budget is not None:
+                budget.step()
+
+            subst = Bindings(occurs_check, budget)
+            rule_frame = subst.frame()
+            head_subst = unify(rule.head, goal, subst, head=True, x_frame=rule_frame)
+            for new_subst in backward_chain_and(kb, rule.body, head_subst, ancestors, tables, rule_frame):
+                answer = subst_all(goal, new_subst)
+                if answer not in known:
+                    known.add(answer)
+                    answers.append(answer)
+                    tables.additions += 1
+                    if budget is not None:
+                        budget.check()
+
+    del tables.evaluating[key]
+
+    if tables.floor >= depth:
+        # Leader: nothing it depends on is still being evaluated
+        tables.complete.add(key)
+        tables.complete.update(tables.incomplete[incomplete:])
+        del tables.incomplete[incomplete:]
+        tables.floor = floor
     else:
-        for substs1 in backward_chain_or(kb, subst_all(~goals[0], subst), subst):
-            for subst2 in backward_chain_and(kb, goals[1:], substs1):
-                yield subst2
-
+        tables.incomplete.append(key)
+        tables.floor = min(floor, tables.floor)
+
+
+class _Action(Enum):
+    """Steps of the traversal of `subst_all`"""
+    VISIT = "visit"
+    BUILD = "build"
+    BIND = "bind"
+
+
+def subst_all(clause, subst: Bindings, frame=0):
+    """Applies every binding in `subst` to `clause` (read in `frame`) in a single traversal (with an explicit stack).
+    Subterms without bound variables are returned as they are, not rebuilt.
+    Unbound variables of frames other than 0 are named after their frame (`X@3`).
+    Raises `RuntimeError` on a cyclic binding (e.g. `X = f(X)`, which unification allows with `OccursCheck.NEVER`)."""
+    resolved = {}
+    # Variables whose value is being substituted
+    pending = set()
+    results = []
+    todo = [(_Action.VISIT, clause, frame)]
+
+    while todo:
+        action, term, frame = todo.pop()
+
+        if action is _Action.VISIT:
+            if type(term) is Var:
+                key = (term, frame)
+                if key in resolved:
+                    results.append(resolved[key])
+                    continue
+                if key in pending:
+                    raise RuntimeError(f"cyclic binding of {term} while substituting {clause}")
+
+                value, value_frame = subst.walk(term, frame)
+                if type(value) is Var:
+                    results.append(value if value_frame == 0 else Var(f"{value.name}@{value_frame}"))
+                else:
+                    pending.add(key)
+                    todo.append((_Action.BIND, key, None))
+                    todo.append((_Action.VISIT, value, value_frame))
+            else:
+                children = _children(term)
+                if children:
+                    todo.append((_Action.BUILD, term, frame))
+                    todo.extend((_Action.VISIT, child, frame) for child in reversed(children))
+                else:
+                    results.append(term)
+        elif action is _Action.BUILD:
+            children = _children(term)
+            args = results[len(results) - len(children):]
+            del results[len(results) - len(children):]
+
+            if any(new is not old for new, old in zip(args, children)):
+                term = _rebuild(term, args)
+            results.append(term)
+        else:
+            # Value of a bound variable: every other occurrence of the variable reuses it
+            pending.discard(term)
+            resolved[term] = results[-1]
+
+    return results.pop()
+
+
+def _children(term):
+    if type(term) is RelationInstance:
+        return term.vars
+    elif type(term) is FunctionInstance:
+        return term.arg,
+    elif isinstance(term, Operator):
+        return term.operand1, term.operand2
+    elif isinstance(term, FreeClause):
+        return term.terms
+    elif isinstance(term, Clause):
+        return tuple(term.terms)
+    return ()
+
+
+def _rebuild(term, args):
+    if type(term) is RelationInstance:
+        return RelationInstance(term.relation_name, *args, negate=term.negate)
+    elif type(term) is FunctionInstance:
+        return FunctionInstance(term.function_name, args[0], term.negate)
+    elif isinstance(term, Operator):
+        return type(term)(args[0], args[1], term.negate)
+    elif isinstance(term, FreeClause):
+        return type(term)(args, term.negate)
+    elif isinstance(term, HornClause):
+        # The body keeps its order (literals that became equal are merged)
+        substituted = dict(zip(_children(term), args))
+        return type(term)(frozenset(args), term.negate, body=dict.fromkeys(substituted[goal] for goal in term.body))
+    else:
+        return type(term)(frozenset(args), term.negate)
 
-def solve(kb: HornKB, query):
-    subst_gen = backward_chain_query(kb, query)
 
-    for subst in subst_gen:
-        return subst_all(FreeClause(list(query.terms)), subst)
+def solve(kb: HornKB, query, tables=None, occurs_check=OccursCheck.ALWAYS, budget=None):
+    """First answer to `query`, or `None`. If `budget` runs out first, `budget.exceeded` is set
+    (and `None` means unknown rather than not provable)"""
+    for answer in solve_iter(kb, query, limit=1, tables=tables, occurs_check=occurs_check, budget=budget):
+        return answer
 
     return None
 
 
+def solve_iter(kb: HornKB, query, limit=None, offset=0, distinct=False, tables=None,
+               occurs_check=OccursCheck.ALWAYS, budget=None):
+    """Generator of the answers to `query` (its terms with the bindings of a proof applied), in search order.
+    Answers are computed lazily: only the current proof is kept in memory (plus the answers seen so far
+    if `distinct`, so that repeated answers are skipped). The first `offset` answers are skipped
+    and at most `limit` answers are yielded.
+    The search stops early if `budget` (a `Budget`) runs out: then `budget.exceeded` is set
+    and the answers yielded are partial."""
+    seen = set() if distinct else None
+    skipped = 0
+    yielded = 0
+
+    if limit is not None and limit <= 0:
+        return
+
+    try:
+        for subst in backward_chain_query(kb, query, tables, occurs_check, budget):
+            answer = subst_all(FreeClause(list(query.terms)), subst)
+
+            if distinct:
+                key = tuple(answer.terms)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+            if skipped < offset:
+                skipped += 1
+                continue
+
+            yield answer
+            yielded += 1
+            if yielded == limit:
+                return
+    except BudgetExceeded:
+        return
+
+
+def findall(kb: HornKB, query, limit=None, offset=0, distinct=False, tables=None, occurs_check=OccursCheck.ALWAYS,
+            budget=None):
+    """List of the answers to `query`, see `solve_iter`"""
+    return list(solve_iter(kb, query, limit, offset, distinct, tables, occurs_check, budget))
+
+
+class Answers:
+    """Answers to a query, to be paged through: each page resumes the search where the previous one stopped,
+    so earlier answers are never recomputed. `exhausted` tells whether the search is over and found every answer,
+    which is not the case if it ran out of `budget` (see `Budget.exceeded`)"""
+
+    def __init__(self, kb: HornKB, query, distinct=False, tables=None, occurs_check=OccursCheck.ALWAYS, budget=None):
+        self.answers = solve_iter(kb, query, distinct=distinct, tables=tables, occurs_check=occurs_check,
+                                  budget=budget)
+        self.budget = budget
+        self.position = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            answer = next(self.answers)
+        except StopIteration:
+            self.exhausted = self.budget is None or self.budget.exceeded is None
+            raise
+
+        self.position += 1
+        return answer
+
+    def page(self, size):
+        """The next `size` answers (fewer if the search runs out of them)"""
+        return list(itertools.islice(self, size))
+
+
 def prettify(clause: HornClause):
     new_body = HornClause._make_or(clause.body)
     free_clause = FreeClause([Or(clause.head, ~new_body)])
@@ -1,10 +1,14 @@
-from abc import ABC, abstractmethod
+import heapq
+import threading
+from abc import ABC, ABCMeta, abstractmethod
 from collections import Counter
 from typing import FrozenSet, List, Tuple
+from weakref import KeyedRef
 
 
 class Term(ABC):
     negate: bool
+    __slots__ = ("negate", "__weakref__")
 
     def __init__(self, negate=False):
         object.__setattr__(self, "negate", negate)
@@ -25,21 +29,72 @@ class Term(ABC):
     def __iter__(self):
         return iter({self})
 
+    def functor(self):
+        """Name and arity of the term, used as key when indexing clauses. `None` means that the term
+        could unify with any other term (e.g. a variable)"""
+        return None
 
-class Literal(Term):
+
+class Interned(ABCMeta):
+    """Metaclass for hash-consed terms: constructing a term structurally equal to one that is still alive
+    returns the existing object, so equal terms are the same object and are compared by identity.
+    Classes using it define `_key`, the structure of a term from the constructor's arguments.
+    Every class gets its own table of weak references, so unused terms are still garbage collected."""
+
+    _lock = threading.Lock()
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        table = {}
+
+        def discard(ref):
+            if table.get(ref.key) is ref:
+                del table[ref.key]
+
+        cls._interned = table
+        cls._discard = staticmethod(discard)
+
+    def __call__(cls, *args, **kwargs):
+        key = cls._key(*args, **kwargs)
+        ref = cls._interned.get(key)
+        term = None if ref is None else ref()
+
+        if term is None:
+            with Interned._lock:
+                ref = cls._interned.get(key)
+                term = None if ref is None else ref()
+
+                if term is None:
+                    term = super().__call__(*args, **kwargs)
+                    cls._interned[key] = KeyedRef(term, cls._discard, key)
+
+        return term
+
+
+class Literal(Term, metaclass=Interned):
     """A single propositional literal.
-    This class is immutable. It supports the call operator to get the literal's value,
+    This class is immutable and interned. It supports the call operator to get the literal's value,
     and bitwise negation (~) to get a logically negated literal"""
 
     name: str
+    __slots__ = ("name", "_hash")
 
     def __init__(self, name: str, negate: bool = False):
         super().__init__(negate)
         object.__setattr__(self, "name", name)
+        object.__setattr__(self, "_hash", hash(("Literal", name, negate)))
+
+    @staticmethod
+    def _key(name: str, negate: bool = False):
+        return (name, True) if negate else name
 
     def __invert__(self):
         return Literal(self.name, not self.negate)
 
+    def __reduce__(self):
+        # Copies and unpickled literals go through the constructor, so they are interned too
+        return Literal, (self.name, self.negate)
+
     def __str__(self):
         string = ""
         if self.negate:
@@ -55,15 +110,19 @@ class Literal(Term):
         return type(item) is Literal and self.name == item.name
 
     def __eq__(self, other):
-        return type(other) is Literal and self.name == other.name and self.negate == other.negate
+        return self is other
 
     def __hash__(self):
-        return hash(self.negate) ^ hash(self.name) ^ hash("Literal")
+        return self._hash
+
+    def functor(self):
+        return self.name, 0
 
 
 class Operator(Term, ABC):
     operand1: Term
     operand2: Term
+    __slots__ = ("operand1", "operand2")
 
     def __init__(self, operand1, operand2, negate=False):
         super().__init__(negate)
@@ -73,8 +132,14 @@ class Operator(Term, ABC):
     def __contains__(self, item: Term):
         return item in self.operand1 or item in self.operand2
 
+    def __reduce__(self):
+        # Slotted and immutable: copies and unpickled terms are rebuilt through the constructor
+        return type(self), (self.operand1, self.operand2, self.negate)
+
 
 class Or(Operator):
+    __slots__ = ()
+
     def __invert__(self):
         return Or(self.operand1, self.operand2, not self.negate)
 
@@ -91,6 +156,8 @@ class Or(Operator):
 
 
 class And(Operator):
+    __slots__ = ()
+
     def __invert__(self):
         return And(self.operand1, self.operand2, not self.negate)
 
@@ -107,6 +174,8 @@ class And(Operator):
 
 
 class Implies(Operator):
+    __slots__ = ()
+
     def __invert__(self):
         return Implies(self.operand1, self.operand2, not self.negate)
 
@@ -123,6 +192,8 @@ class Implies(Operator):
 
 
 class Iff(Operator):
+    __slots__ = ()
+
     def __invert__(self):
         return Iff(self.operand1, self.operand2, not self.negate)
 
@@ -140,6 +211,7 @@ class Iff(Operator):
 
 class FreeClause(Term):
     terms: List[Term]
+    __slots__ = ("terms",)
 
     def __init__(self, terms, negate: bool = False):
         super().__init__(negate)
@@ -168,8 +240,13 @@ class FreeClause(Term):
     def __invert__(self):
         return FreeClause(self.terms, not self.negate)
 
+    def __reduce__(self):
+        return type(self), (self.terms, self.negate)
+
 
 class HornFreeClause(FreeClause):
+    __slots__ = ("head", "body")
+
     def __init__(self, terms, negate: bool = False):
         super().__init__(terms, negate)
 
@@ -202,6 +279,7 @@ class Clause(Term):
     from the clause, and insiemistic inclusion (`in`) to check whether the clause contains a literal (`Literal`)."""
 
     terms: FrozenSet[Term]
+    __slots__ = ("terms", "_hash")
 
     def __init__(self, terms=frozenset(), negate: bool = False):
         super().__init__(negate)
@@ -209,7 +287,9 @@ class Clause(Term):
         if type(terms) not in [frozenset, set]:
             raise TypeError("terms argument must be either set or frozenset!")
 
+        terms = frozenset(terms)
         object.__setattr__(self, "terms", terms)
+        object.__setattr__(self, "_hash", hash(negate) ^ hash(terms) ^ hash("Clause"))
 
     def __str__(self):
         string = ""
@@ -254,7 +334,10 @@ class Clause(Term):
         return isinstance(other, Clause) and self.negate == other.negate and self.terms == other.terms
 
     def __hash__(self):
-        return hash(self.negate) ^ hash(tuple(self.terms)) ^ hash("Clause")
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), (self.terms, self.negate)
 
     def to_free_clause(self):
         terms = Clause._make_or(self.terms)
@@ -275,7 +358,10 @@ class Clause(Term):
 
 
 class HornClause(Clause):
-    def __init__(self, vars=frozenset(), negate=False):
+    __slots__ = ("head", "body")
+
+    def __init__(self, vars=frozenset(), negate=False, body=None):
+        """`body` optionally gives the order in which the negative literals are proved"""
         super().__init__(vars, negate)
 
         if not HornClause.is_horn(vars):
@@ -285,7 +371,14 @@ class HornClause(Clause):
             if not var.negate:
                 object.__setattr__(self, 'head', var)
 
-        object.__setattr__(self, 'body', [var for var in vars if var.negate])
+        if body is None:
+            body = [var for var in self.terms if var.negate]
+        else:
+            body = list(body)
+            if len(set(body)) != len(body) or set(body) != {var for var in self.terms if var.negate}:
+                raise TypeError("the body of a Horn clause must list each of its negative literals once")
+
+        object.__setattr__(self, 'body', body)
 
     def __repr__(self):
         return f"HornClause{{terms={self.terms}, negate={self.negate}}}"
@@ -294,7 +387,10 @@ class HornClause(Clause):
         return super().__eq__(other)
 
     def __hash__(self):
-        return super.__hash__(self)
+        return super().__hash__()
+
+    def __reduce__(self):
+        return HornClause, (self.terms, self.negate, self.body)
 
     def from_clause(clause: Clause):
         return HornClause(clause.terms)
@@ -317,6 +413,14 @@ class KB:
 
         object.__setattr__(self, "clauses", tuple(clauses))
 
+    @classmethod
+    def from_iterable(cls, clauses):
+        """Bulk-loads a KB from any iterable of clauses (e.g. a generator), dropping duplicates, in linear time"""
+        builder = KBBuilder(cls)
+        builder.update(clauses)
+
+        return builder.build()
+
     def __str__(self):
         string = "("
         string += " ∧ ".join([str(clause) for clause in self.clauses])
@@ -331,14 +435,14 @@ class KB:
         return clause in self.clauses
 
     def __add__(self, other):
-        new = KB(self.clauses)
+        """A new KB with the clauses of `other` (a clause or an iterable of clauses) too, without duplicates.
+        KBs are immutable, so this copies the KB in O(N): `kb += clause` in a loop is quadratic.
+        Don't use it for bulk loading: add the clauses to a `KBBuilder`, or use `KB.from_iterable`"""
+        builder = KBBuilder(KB)
+        builder.update(self.clauses)
+        builder.update(iter(other))
 
-        for term in iter(other):
-            counter = Counter(new.clauses)
-            if counter[term] == 0:
-                new = KB(list(new.clauses) + [term])
-
-        return new
+        return builder.build()
 
     def __sub__(self, other: Clause):
         clauses = list(self.clauses)
@@ -348,6 +452,10 @@ class KB:
     def __iter__(self):
         return iter(self.clauses)
 
+    def __reduce__(self):
+        # A `HornKB` rebuilds its indexes rather than copying them
+        return type(self), (self.clauses,)
+
     def to_free_clause(self):
         terms = KB._make_and(self.clauses)
 
@@ -355,13 +463,154 @@ class KB:
 
     @staticmethod
     def _make_and(terms):
-        terms = list(terms)
-        if len(terms) <= 1:
-            return terms[0]
-        if len(terms) == 2:
-            return And(terms[0], terms[1])
+        """Conjunction of `terms` as a balanced tree, so that its depth is logarithmic in the number of terms"""
+        layer = list(terms)
+        while len(layer) > 1:
+            layer = [And(layer[i], layer[i + 1]) if i + 1 < len(layer) else layer[i]
+                     for i in range(0, len(layer), 2)]
+
+        return layer[0]
+
+
+class ClauseIndex:
+    """Index of Horn clauses by head, used to find the clauses that could resolve a goal.
+    Clauses are grouped by the functor of their head (name and arity), then hashed on the functor
+    of the head's first argument. Clauses whose first argument is a variable match every goal,
+    so they are kept apart and merged back in KB order on lookup."""
+
+    def __init__(self, clauses=()):
+        self.predicates = {}
+        self.size = 0
+
+        for clause in clauses:
+            self.add(clause)
+
+    def add(self, clause):
+        head = clause.head
+        predicate = self.predicates.get(head.functor())
+        if predicate is None:
+            predicate = _PredicateIndex()
+            self.predicates[head.functor()] = predicate
+
+        entry = (self.size, clause)
+        self.size += 1
+
+        predicate.clauses.append(entry)
+        key = _first_argument_key(head)
+        if key is None:
+            predicate.unindexed.append(entry)
         else:
-            return And(terms[0], KB._make_and(terms[1:]))
+            predicate.buckets.setdefault(key, []).append(entry)
+
+    def lookup(self, goal, first_argument=None):
+        """Returns the `(position, clause)` pairs whose head could unify with `goal`, in KB order.
+        `first_argument` is the value of the goal's first argument, if it's a bound variable"""
+        predicate = self.predicates.get(goal.functor())
+        if predicate is None:
+            return []
+
+        key = _first_argument_key(goal) if first_argument is None else first_argument.functor()
+        if key is None:
+            return predicate.clauses
+
+        bucket = predicate.buckets.get(key, [])
+        if not predicate.unindexed:
+            return bucket
+        if not bucket:
+            return predicate.unindexed
+
+        return list(heapq.merge(bucket, predicate.unindexed, key=lambda entry: entry[0]))
+
+
+class _PredicateIndex:
+    def __init__(self):
+        self.clauses = []
+        self.buckets = {}
+        self.unindexed = []
+
+
+def _first_argument_key(term):
+    args = getattr(term, "vars", ())
+    if not args:
+        return None
+
+    return args[0].functor()
+
+
+class DependencyGraph:
+    """Predicate dependency graph of a Horn KB. There is an edge from the predicate in the head of a clause
+    to every predicate in its body. Strongly connected components are computed once, so that the search
+    knows in advance which predicates can call themselves (directly or through other predicates)."""
+
+    def __init__(self, clauses=()):
+        self.edges = {}
+
+        for clause in clauses:
+            successors = self.edges.setdefault(clause.head.functor(), set())
+            successors.update(term.functor() for term in clause.body)
+
+        self.components = _strongly_connected_components(self.edges)
+        self.recursive = {}
+
+        for component in self.components:
+            if len(component) > 1 or component[0] in self.edges.get(component[0], ()):
+                for predicate in component:
+                    self.recursive[predicate] = component
+
+    def is_recursive(self, predicate):
+        return predicate in self.recursive
+
+    def component(self, predicate):
+        """Predicates mutually recursive with `predicate` (empty if `predicate` is not recursive)"""
+        return self.recursive.get(predicate, [])
+
+
+def _strongly_connected_components(edges):
+    """Tarjan's algorithm, with an explicit stack instead of recursion"""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in edges:
+        if root in index:
+            continue
+
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+
+        while work:
+            node, successors = work[-1]
+
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges.get(successor, ()))))
+                    break
+                elif successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == index[node]:
+                    component = []
+                    member = None
+                    while member != node:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+
+                    components.append(component)
+
+    return components
 
 
 class HornKB(KB):
@@ -370,21 +619,61 @@ class HornKB(KB):
             if not HornFreeClause.is_horn(clause.terms):
                 raise TypeError("HornKB must be composed only of Horn clauses")
 
-        horn_clauses = [HornClause.from_clause(clause) for clause in clauses]
+        horn_clauses = [clause if type(clause) is HornClause else HornClause.from_clause(clause)
+                        for clause in clauses]
         super().__init__(horn_clauses)
+        object.__setattr__(self, "index", ClauseIndex(self.clauses))
+        object.__setattr__(self, "dependencies", DependencyGraph(self.clauses))
 
     def __repr__(self):
         return f"HornKB{{clauses={self.clauses}}}"
 
-    def __add__(self, other):
-        if not HornFreeClause.is_horn(other):
-            raise ValueError("Cannot add non-Horn clause to HornKB")
+    def candidates(self, goal, first_argument=None):
+        """Clauses whose head could unify with `goal`, in KB order
+        (`first_argument` is the value of its first argument, if it's a bound variable)"""
+        return [clause for _, clause in self.index.lookup(goal, first_argument)]
 
-        new = HornKB(self.clauses)
+    def __add__(self, other):
+        """See `KB.__add__`: this also rebuilds the indexes, so use a `KBBuilder` for bulk loading"""
+        builder = KBBuilder(HornKB)
+        builder.update(self.clauses)
 
         for term in iter(other):
-            counter = Counter(new.clauses)
-            if counter[term] == 0:
-                new = HornKB(list(new.clauses) + [term])
+            if not HornFreeClause.is_horn(term.terms):
+                raise ValueError("Cannot add non-Horn clause to HornKB")
+            builder.add(term)
 
-        return new
+        return builder.build()
+
+
+class KBBuilder:
+    """Incremental construction of a `KB` (or of a subclass, like `HornKB`).
+    Adding a clause takes O(1) amortized time: duplicates are dropped with a hash set,
+    and the KB (with its indexes) is built once, by `build`."""
+
+    def __init__(self, kb_class=KB):
+        self.kb_class = kb_class
+        self.clauses = []
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.clauses)
+
+    def __iadd__(self, clause):
+        return self.add(clause)
+
+    def add(self, clause):
+        if clause not in self.seen:
+            self.seen.add(clause)
+            self.clauses.append(clause)
+
+        return self
+
+    def update(self, clauses):
+        for clause in clauses:
+            self.add(clause)
+
+        return self
+
+    def build(self):
+        return self.kb_class(self.clauses)
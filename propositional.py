@@ -1,6 +1,7 @@
-from collections import defaultdict
+from array import array
+from weakref import WeakKeyDictionary
 
-from primitives import Clause, Literal, HornKB, HornClause
+from primitives import Clause, Literal, KB, HornKB
 
 
 def unit_resolution(clause: Clause, literal: Literal) -> Clause:
@@ -8,29 +9,187 @@ def unit_resolution(clause: Clause, literal: Literal) -> Clause:
     return clause - ~literal
 
 
-def forward_chaining_solve(knowledge_base: HornKB, query: Literal) -> bool:
-    """Propositional logic entailment check with forward chaining.
-    (Answers to question: knowledge_base ⊨? query)"""
+class PackedKB:
+    """Compact encoding of a propositional KB, for algorithms that only need integer operations.
+    Atoms are numbered from 1 by name, and a literal is the number of its atom (negative if the literal is negated).
+    Clauses are sorted runs of literals in a single array, delimited by `offsets`, and each clause has a 64-bit
+    signature (a Bloom filter of its literals) that rules out most subsumption checks with a single `&`."""
+
+    def __init__(self, clauses=()):
+        self.atoms = {}
+        self.names = [None]
+        self.literals = array("l")
+        self.offsets = array("l", [0])
+        self.signatures = array("Q")
+
+        for clause in clauses:
+            self.add(clause)
+
+    @classmethod
+    def from_kb(cls, kb: KB):
+        return cls(kb.clauses)
+
+    def to_kb(self, kb_class=KB):
+        return kb_class([self.unpack(clause) for clause in self])
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __getitem__(self, number):
+        return tuple(self.literals[self.offsets[number]:self.offsets[number + 1]])
+
+    def __iter__(self):
+        literals, offsets = self.literals, self.offsets
+        for number in range(len(self)):
+            yield tuple(literals[offsets[number]:offsets[number + 1]])
+
+    def atom(self, name: str) -> int:
+        """Number of the atom called `name`, adding it if it's new"""
+        number = self.atoms.get(name)
+        if number is None:
+            number = len(self.names)
+            self.atoms[name] = number
+            self.names.append(name)
+
+        return number
+
+    def pack(self, clause: Clause) -> list:
+        """Sorted literals of `clause`"""
+        atoms = self.atoms
+        literals = []
+        for term in clause.terms:
+            if type(term) is not Literal:
+                raise TypeError(f"only propositional clauses can be packed: {clause}")
+
+            number = atoms.get(term.name)
+            if number is None:
+                number = self.atom(term.name)
+            literals.append(-number if term.negate else number)
+
+        literals.sort()
+        return literals
+
+    def unpack(self, literals) -> Clause:
+        return Clause({Literal(self.names[abs(literal)], literal < 0) for literal in literals})
+
+    def add(self, clause):
+        """Adds a `Clause`, or a clause already packed (any iterable of literals of this KB's atoms).
+        Returns its number"""
+        if isinstance(clause, Clause):
+            literals = self.pack(clause)
+        else:
+            literals = sorted(clause)
+            if any(not 0 < abs(literal) <= len(self.atoms) for literal in literals):
+                raise ValueError(f"packed clause with a literal of an unknown atom: {literals}")
+
+        self.literals.extend(literals)
+        self.offsets.append(len(self.literals))
+        self.signatures.append(PackedKB.signature(literals))
+
+        return len(self.signatures) - 1
+
+    @staticmethod
+    def signature(literals) -> int:
+        signature = 0
+        for literal in literals:
+            signature |= 1 << (literal & 63)
+
+        return signature
 
-    knowledge_base = HornKB(knowledge_base.clauses)
-    count = {clause: len(clause.body) for clause in knowledge_base}
-    inferred = defaultdict(bool)
-    knowns = [clause.head for clause in knowledge_base]
+    @staticmethod
+    def unit_resolution(clause: tuple, literal: int) -> tuple:
+        """Unit resolution rule, on packed clauses"""
+        return tuple(other for other in clause if other != -literal)
 
-    while knowns:
-        p = knowns.pop()
+    def subsumes(self, number: int, other: int) -> bool:
+        """Whether clause `number` subsumes clause `other` (its literals are a subset of the other's)"""
+        if self.signatures[number] & ~self.signatures[other]:
+            return False
 
-        if p == query:
-            return True
-        if not inferred[p]:
-            inferred[p] = True
+        return set(self[number]).issubset(self[other])
 
-            clauses_with_p = [clause for clause in knowledge_base if p in clause]
 
-            for clause in clauses_with_p:
-                count[clause] -= 1
+class WatchIndex:
+    """Index of a propositional Horn KB (packed) for forward chaining: clauses with more than one positive literal
+    raise `TypeError`. Every atom watches the clauses whose body contains it, so that inferring it only touches
+    those clauses. Clause heads and body sizes are kept in arrays, copied as counters by each entailment check:
+    a check takes time linear in the size of the KB (Dowling–Gallier), and the index is built once per KB."""
+
+    def __init__(self, kb: PackedKB):
+        self.kb = kb
+        self.heads = array("l")
+        self.sizes = array("l")
+        self.watches = [array("l") for _ in kb.names]
+        self.facts = array("l")
+
+        literals, offsets = kb.literals, kb.offsets
+        for number in range(len(kb)):
+            start, end = offsets[number], offsets[number + 1]
+
+            # Negative literals sort first: the head, if any, is the last literal (clauses without one
+            # conclude the unused atom 0)
+            head = literals[end - 1] if end > start else 0
+            if head > 0:
+                end -= 1
+                if end > start and literals[end - 1] > 0:
+                    raise TypeError(f"forward chaining needs Horn clauses: {kb.unpack(kb[number])}")
+            else:
+                head = 0
+
+            self.heads.append(head)
+            self.sizes.append(end - start)
+            if end > start:
+                for position in range(start, end):
+                    self.watches[-literals[position]].append(number)
+            else:
+                self.facts.append(number)
+
+    def inferred(self, query: int = -1) -> bytearray:
+        """Flags of the atoms entailed by the KB, by atom number. Stops early once `query` is inferred"""
+        count = array("l", self.sizes)
+        inferred = bytearray(len(self.watches))
+        heads, watches = self.heads, self.watches
+        agenda = [heads[number] for number in self.facts]
+
+        while agenda:
+            p = agenda.pop()
+            if inferred[p]:
+                continue
+
+            inferred[p] = 1
+            if p == query:
+                break
+
+            for number in watches[p]:
+                count[number] -= 1
+                if count[number] == 0:
+                    agenda.append(heads[number])
+
+        return inferred
+
+    def entails(self, query: Literal) -> bool:
+        number = None if query.negate else self.kb.atoms.get(query.name)
+        return number is not None and bool(self.inferred(number)[number])
+
+
+_watch_indexes = WeakKeyDictionary()
+
+
+def watch_index(knowledge_base: HornKB) -> WatchIndex:
+    """The `WatchIndex` of `knowledge_base`, built on first use"""
+    index = _watch_indexes.get(knowledge_base)
+    if index is None:
+        index = WatchIndex(PackedKB.from_kb(knowledge_base))
+        _watch_indexes[knowledge_base] = index
+
+    return index
+
+
+def forward_chaining_solve(knowledge_base: HornKB, query: Literal) -> bool:
+    """Propositional logic entailment check with forward chaining.
+    (Answers to question: knowledge_base ⊨? query)"""
 
-                if count[clause] == 0:
-                    knowns += [HornClause.from_clause(clause).head]
+    if type(knowledge_base) is not HornKB:
+        knowledge_base = HornKB(knowledge_base.clauses)
 
-    return False
+    return watch_index(knowledge_base).entails(query)
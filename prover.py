@@ -0,0 +1,408 @@
+import heapq
+import itertools
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from first_order import Var, RelationInstance, FunctionInstance
+from predicate import Predicate, Bindings, Budget, BudgetExceeded, OccursCheck, unify, subst_all
+from primitives import Clause, KB, Term
+from visitor import VariantVisitor
+
+
+def _atom(literal):
+    return ~literal if literal.negate else literal
+
+
+def _arguments(term):
+    if type(term) is RelationInstance:
+        return term.vars
+    elif type(term) is FunctionInstance:
+        return term.arg,
+    return ()
+
+
+def _weight(term):
+    """Number of symbols (and variables) in `term`"""
+    weight = 0
+    todo = [term]
+    while todo:
+        term = todo.pop()
+        weight += 1
+        todo.extend(_arguments(term))
+
+    return weight
+
+
+def _measure(term):
+    """Weight of `term` and occurrences of each of its variables (`None` if it's ground)"""
+    weight = 0
+    variables = None
+    todo = [term]
+    while todo:
+        term = todo.pop()
+        weight += 1
+        if type(term) is Var:
+            if variables is None:
+                variables = Counter()
+            variables[term] += 1
+        else:
+            todo.extend(_arguments(term))
+
+    return weight, variables
+
+
+def _greater(s, t):
+    """Knuth–Bendix order on terms: every symbol weighs 1, and symbols are ordered by arity, then by name"""
+    if s is t or type(s) is Var:
+        return False
+
+    s_weight, s_variables = _measure(s)
+    if type(t) is Var:
+        return s_variables is not None and t in s_variables
+
+    t_weight, t_variables = _measure(t)
+    if t_variables is not None and (s_variables is None or
+                                    any(s_variables[var] < count for var, count in t_variables.items())):
+        return False
+
+    if s_weight != t_weight:
+        return s_weight > t_weight
+
+    (s_name, s_arity), (t_name, t_arity) = s.functor(), t.functor()
+    if (s_name, s_arity) != (t_name, t_arity):
+        return (s_arity, s_name) > (t_arity, t_name)
+
+    for s_arg, t_arg in zip(_arguments(s), _arguments(t)):
+        if s_arg is not t_arg:
+            return _greater(s_arg, t_arg)
+
+    return False
+
+
+def _literal_greater(m, l):
+    """Order on literals: the order on their atoms, with a negative literal above the positive one"""
+    m_atom, l_atom = _atom(m), _atom(l)
+    if m_atom is l_atom:
+        return m.negate and not l.negate
+
+    return _greater(m_atom, l_atom)
+
+
+def _maximal(literal, literals):
+    return not any(_literal_greater(other, literal) for other in literals)
+
+
+def _match(pattern, target, bindings):
+    """`bindings` extended so that `pattern` becomes `target` (only variables of `pattern` are bound), or `None`"""
+    todo = [(pattern, target)]
+    extended = bindings
+
+    while todo:
+        pattern, target = todo.pop()
+
+        if type(pattern) is Var:
+            bound = extended.get(pattern)
+            if bound is None:
+                if extended is bindings:
+                    extended = dict(bindings)
+                extended[pattern] = target
+            elif bound is not target:
+                return None
+        elif type(pattern) is not type(target) or pattern.functor() != target.functor():
+            return None
+        elif type(pattern) is RelationInstance or type(pattern) is FunctionInstance:
+            todo.extend(zip(_arguments(pattern), _arguments(target)))
+        elif pattern is not target:
+            return None
+
+    return extended
+
+
+def _match_literals(literals, targets, bindings):
+    if not literals:
+        return True
+
+    literal, rest = literals[0], literals[1:]
+    for target in targets:
+        if target.negate == literal.negate:
+            extended = _match(_atom(literal), _atom(target), bindings)
+            if extended is not None and _match_literals(rest, targets, extended):
+                return True
+
+    return False
+
+
+def _key(literal):
+    return literal.negate, literal.functor()
+
+
+def _feature(literal):
+    """Key of `literal` refined with the symbol of its first argument (`()` if it's a variable, or if there is none):
+    the literals a literal can match have its sign, its functor and the same first symbol, unless that's `()`"""
+    arguments = _arguments(_atom(literal))
+    first = () if not arguments or type(arguments[0]) is Var else arguments[0].functor()
+
+    return literal.negate, literal.functor(), first
+
+
+class _Clause:
+    __slots__ = ("literals", "number", "weight", "keys", "features")
+
+    def __init__(self, literals, number):
+        self.literals = literals
+        self.number = number
+        self.weight = sum(_weight(_atom(literal)) for literal in literals)
+        self.keys = frozenset(_key(literal) for literal in literals)
+        self.features = frozenset(_feature(literal) for literal in literals)
+
+    def subsumes(self, other) -> bool:
+        """Whether an instance of this clause is a subset of `other`"""
+        if len(self.literals) > len(other.literals) or not self.keys <= other.keys:
+            return False
+
+        return _match_literals(self.literals, other.literals, {})
+
+    def to_clause(self):
+        return Clause(set(self.literals))
+
+
+class _ClauseSet:
+    """Clauses indexed by the sign and functor (the key) of their literals, to find resolution partners,
+    and by their features (see `_feature`), to find subsumption candidates without scanning the whole set"""
+
+    def __init__(self):
+        self.clauses = {}
+        self.by_key = defaultdict(set)
+        self.by_feature = defaultdict(set)
+        self.by_least_feature = defaultdict(set)
+
+    def __contains__(self, clause):
+        return clause.number in self.clauses
+
+    def __len__(self):
+        return len(self.clauses)
+
+    def add(self, clause):
+        self.clauses[clause.number] = clause
+        for key in clause.keys:
+            self.by_key[key].add(clause.number)
+        for feature in clause.features:
+            self.by_feature[feature].add(clause.number)
+        self.by_least_feature[min(clause.features, default=None)].add(clause.number)
+
+    def remove(self, clause):
+        del self.clauses[clause.number]
+        for key in clause.keys:
+            self.by_key[key].discard(clause.number)
+        for feature in clause.features:
+            self.by_feature[feature].discard(clause.number)
+        self.by_least_feature[min(clause.features, default=None)].discard(clause.number)
+
+    def generalizations(self, clause):
+        """Clauses that could subsume `clause`: each of their literals matches one of its literals, so the one with
+        the least feature does (the empty clause is filed under `None`)"""
+        features = {None}
+        for negate, functor, first in clause.features:
+            features.add((negate, functor, first))
+            features.add((negate, functor, ()))
+
+        return [self.clauses[number] for feature in features for number in self.by_least_feature.get(feature, ())]
+
+    def instances(self, clause):
+        """Clauses that could be subsumed by `clause`: they have a literal that each of its literals can match"""
+        if not clause.features:
+            return list(self.clauses.values())
+
+        numbers = set.intersection(*(self.by_feature.get(feature, set()) if feature[2] != () else
+                                     self.by_key.get(feature[:2], set()) for feature in clause.features))
+        return [self.clauses[number] for number in numbers]
+
+    def partners(self, literal):
+        """Clauses with a literal of the opposite sign and the same functor as `literal`"""
+        return [self.clauses[number] for number in self.by_key.get((not literal.negate, literal.functor()), ())]
+
+
+class Prover:
+    """Saturation prover for first-order clauses, by ordered binary resolution and factoring.
+    Given-clause loop: clauses wait in the passive set, and the lightest one (fewest symbols), or the oldest
+    one every `age_ratio` picks, becomes the given clause, is moved to the active set and is resolved with
+    every active clause. Only literals maximal in their clause (Knuth–Bendix order, after unification) are
+    resolved upon. New clauses are dropped if they are tautologies or subsumed by a kept clause (forward
+    subsumption), and delete the kept clauses they subsume (backward subsumption).
+    `budget` (a `predicate.Budget`, if any) counts a step per inference, and `BudgetExceeded` stops the search."""
+
+    def __init__(self, clauses=(), budget=None, age_ratio=5):
+        self.budget = budget
+        self.age_ratio = age_ratio
+        self.active = _ClauseSet()
+        self.passive = _ClauseSet()
+        self.by_weight = []
+        self.by_age = []
+        self.numbers = itertools.count()
+        self.picks = 0
+        self.refuted = False
+
+        for clause in clauses:
+            self.add(clause.terms)
+
+    def add(self, literals):
+        """Adds the clause of `literals` to the passive set, unless it's redundant"""
+        if self.refuted:
+            return
+
+        variant = VariantVisitor()
+        literals = tuple({variant.visit(literal) for literal in literals})
+        if not literals:
+            self.refuted = True
+            return
+        if any(~literal in literals for literal in literals):
+            return
+
+        clause = _Clause(literals, next(self.numbers))
+        for clauses in (self.active, self.passive):
+            if any(other.subsumes(clause) for other in clauses.generalizations(clause)):
+                return
+
+        for clauses in (self.active, self.passive):
+            for other in clauses.instances(clause):
+                if clause.subsumes(other):
+                    clauses.remove(other)
+
+        self.passive.add(clause)
+        heapq.heappush(self.by_weight, (clause.weight, clause.number, clause))
+        heapq.heappush(self.by_age, (clause.number, clause))
+
+    def saturate(self) -> bool:
+        """Runs the given-clause loop: `True` once the empty clause is derived, `False` if the clauses are saturated
+        (every inference from them is redundant) without it"""
+        while not self.refuted:
+            given = self._select()
+            if given is None:
+                return False
+
+            self.passive.remove(given)
+            self.active.add(given)
+
+            for literals in itertools.chain(self._factors(given), self._resolvents(given)):
+                if self.budget is not None:
+                    self.budget.step()
+                self.add(literals)
+
+        return True
+
+    @property
+    def clauses(self):
+        """Clauses kept so far (active and passive)"""
+        return KB([clause.to_clause() for clauses in (self.active, self.passive)
+                   for clause in clauses.clauses.values()])
+
+    def _select(self):
+        self.picks += 1
+        queue = self.by_age if self.picks % self.age_ratio == 0 else self.by_weight
+
+        while queue:
+            clause = heapq.heappop(queue)[-1]
+            if clause in self.passive:
+                return clause
+
+        return None
+
+    def _factors(self, given):
+        literals = given.literals
+        for i, literal in enumerate(literals):
+            if not _maximal(literal, literals):
+                continue
+
+            for other in literals:
+                if other is not literal and _key(other) == _key(literal):
+                    subst = unify(_atom(literal), _atom(other), Bindings(OccursCheck.ALWAYS), x_frame=1, y_frame=1)
+                    if subst is None:
+                        continue
+
+                    instance = [subst_all(term, subst, 1) for term in literals]
+                    if _maximal(instance[i], instance):
+                        yield instance
+
+    def _resolvents(self, given):
+        literals = given.literals
+        for i, literal in enumerate(literals):
+            # The order is stable under substitution: a literal below another one will stay below it
+            if not _maximal(literal, literals):
+                continue
+
+            for partner in self.active.partners(literal):
+                for j, other in enumerate(partner.literals):
+                    if other.negate == literal.negate or other.functor() != literal.functor():
+                        continue
+
+                    subst = unify(_atom(literal), _atom(other), Bindings(OccursCheck.ALWAYS), x_frame=1, y_frame=2)
+                    if subst is None:
+                        continue
+
+                    left = [subst_all(term, subst, 1) for term in literals]
+                    right = [subst_all(term, subst, 2) for term in partner.literals]
+                    if _maximal(left[i], left) and _maximal(right[j], right):
+                        yield left[:i] + left[i + 1:] + right[:j] + right[j + 1:]
+
+
+def entails(kb: KB, query: Term, budget=None, timeout=None):
+    """Entailment check by refutation: kb ⊨? query, `query` being a literal or a `Clause` (a disjunction),
+    with its variables existentially quantified. `kb ∧ ¬query` is saturated until the empty clause is derived
+    (`True`) or no new clause can be (`False`); returns `None` if `budget` (or `timeout` seconds) runs out first"""
+    if budget is None and timeout is not None:
+        budget = Budget(timeout=timeout)
+
+    prover = Prover(kb.clauses, budget)
+    for literal in query.terms if isinstance(query, Clause) else [query]:
+        prover.add([~literal])
+
+    try:
+        return prover.saturate()
+    except BudgetExceeded:
+        return None
+
+
+@dataclass
+class Removed:
+    """Number of clauses dropped by `preprocess`, by reason"""
+    tautologies: int = 0
+    duplicates: int = 0
+    subsumed: int = 0
+
+
+def preprocess(kb):
+    """Drops tautologies, duplicate clauses and clauses subsumed by another one from `kb`, finding subsumption
+    candidates through the literal index of the prover. `kb` is a `KB` (a `HornKB` keeps its clauses as they are)
+    or the `Predicate` returned by `Predicate.propositionalize`; returns the same kind of object, with the clauses
+    left in their order, and the `Removed` counts"""
+    clauses = kb.components if isinstance(kb, Predicate) else kb.clauses
+    removed = Removed()
+    seen = set()
+    kept = _ClauseSet()
+
+    for number, clause in enumerate(clauses):
+        if clause in seen:
+            removed.duplicates += 1
+            continue
+        seen.add(clause)
+
+        if any(~literal in clause.terms for literal in clause.terms):
+            removed.tautologies += 1
+            continue
+
+        candidate = _Clause(tuple(clause.terms), number)
+        if any(other.subsumes(candidate) for other in kept.generalizations(candidate)):
+            removed.subsumed += 1
+            continue
+
+        for other in kept.instances(candidate):
+            if candidate.subsumes(other):
+                kept.remove(other)
+                removed.subsumed += 1
+        kept.add(candidate)
+
+    clauses = [clauses[number] for number in sorted(kept.clauses)]
+    if isinstance(kb, Predicate):
+        return Predicate(tuple(clauses)), removed
+
+    return type(kb)(clauses), removed
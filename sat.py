@@ -0,0 +1,400 @@
+import heapq
+
+from primitives import KB, Term
+
+
+def _luby(i):
+    """`i`-th term (counting from 0) of the Luby sequence: 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ..."""
+    size, power = 1, 0
+    while size < i + 1:
+        size = 2 * size + 1
+        power += 1
+
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        power -= 1
+        i %= size
+
+    return 2 ** power
+
+
+class _Clause:
+    """Clause of the solver. `literals[0]` and `literals[1]` are its watched literals, and `literals[0]` is
+    the literal it implied, if it's the reason of an assignment"""
+
+    __slots__ = ("literals", "learnt", "activity", "deleted")
+
+    def __init__(self, literals, learnt=False):
+        self.literals = literals
+        self.learnt = learnt
+        self.activity = 0.0
+        self.deleted = False
+
+
+class Solver:
+    """Conflict-driven clause-learning SAT solver over the clauses of a `KB`.
+    Every atom (a term with `negate=False`) is a variable `v`, and its literals are `2v` (the atom) and `2v + 1`
+    (its negation). Clauses are propagated with two watched literals; conflicts are analyzed to their first
+    unique implication point, and the learnt clause (minimized) drives a non-chronological backjump.
+    Decisions follow VSIDS activities, with phase saving; restarts follow the Luby sequence, and learnt
+    clauses are halved by activity when they outgrow the KB.
+    `solve` can be called repeatedly, with different assumptions: learnt clauses are kept between calls.
+    `budget` (a `predicate.Budget`, if any) counts a step per conflict, and `BudgetExceeded` stops the search."""
+
+    def __init__(self, kb: KB = KB(), budget=None, restart_base=100, variable_decay=0.95, clause_decay=0.999):
+        self.budget = budget
+        self.restart_base = restart_base
+        self.variable_decay = variable_decay
+        self.clause_decay = clause_decay
+
+        # By variable
+        self.atoms = {}
+        self.terms = []
+        self.level = []
+        self.reason = []
+        self.activity = []
+        self.phase = []
+        self.seen = bytearray()
+        # By literal: 1 if true, -1 if false, 0 if unassigned
+        self.values = []
+        self.watches = []
+
+        self.trail = []
+        self.limits = []
+        self.head = 0
+        self.heap = []
+        self.clauses = []
+        self.learnts = []
+        self.variable_increment = 1.0
+        self.clause_increment = 1.0
+        self.conflicts = 0
+        self.model = None
+        self.ok = True
+
+        for clause in kb.clauses:
+            self.add_clause(clause.terms)
+
+        self.max_learnts = max(len(self.clauses) / 3, 100)
+
+    def variable(self, atom: Term) -> int:
+        variable = self.atoms.get(atom)
+        if variable is None:
+            variable = len(self.terms)
+            self.atoms[atom] = variable
+            self.terms.append(atom)
+            self.level.append(0)
+            self.reason.append(None)
+            self.activity.append(0.0)
+            self.phase.append(1)
+            self.seen.append(0)
+            self.values += [0, 0]
+            self.watches += [[], []]
+            heapq.heappush(self.heap, (0.0, variable))
+
+        return variable
+
+    def literal(self, term: Term) -> int:
+        if term.negate:
+            return 2 * self.variable(~term) + 1
+
+        return 2 * self.variable(term)
+
+    def add_clause(self, terms) -> bool:
+        """Adds the clause of `terms`; `False` if the clauses are now unsatisfiable"""
+        if not self.ok:
+            return False
+
+        self._cancel(0)
+        literals = set()
+        for term in terms:
+            literal = self.literal(term)
+            if literal ^ 1 in literals or self.values[literal] == 1:
+                return True
+            if self.values[literal] == 0:
+                literals.add(literal)
+
+        literals = list(literals)
+        if not literals:
+            self.ok = False
+        elif len(literals) == 1:
+            self._assign(literals[0], None)
+            self.ok = self._propagate() is None
+        else:
+            clause = _Clause(literals)
+            self.clauses.append(clause)
+            self._watch(clause)
+
+        return self.ok
+
+    def solve(self, assumptions=()) -> bool:
+        """Whether the clauses are satisfiable together with `assumptions` (terms taken as true).
+        If they are, `model` is the set of literals (terms or negated terms) of a satisfying assignment"""
+        self.model = None
+        if not self.ok:
+            return False
+
+        assumptions = [self.literal(term) for term in assumptions]
+        self._cancel(0)
+
+        restarts = 0
+        status = None
+        try:
+            while status is None:
+                status = self._search(self.restart_base * _luby(restarts), assumptions)
+                restarts += 1
+                self.max_learnts *= 1.1
+        finally:
+            self._cancel(0)
+
+        return status
+
+    def _search(self, max_conflicts, assumptions):
+        """CDCL until a verdict (`True` or `False`), or `None` after `max_conflicts` conflicts (a restart)"""
+        values = self.values
+        conflicts = 0
+
+        while True:
+            conflict = self._propagate()
+
+            if conflict is not None:
+                conflicts += 1
+                self.conflicts += 1
+                if self.budget is not None:
+                    self.budget.step()
+
+                if not self.limits:
+                    self.ok = False
+                    return False
+
+                learnt, level = self._analyze(conflict)
+                self._cancel(level)
+
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                else:
+                    clause = _Clause(learnt, learnt=True)
+                    self.learnts.append(clause)
+                    self._watch(clause)
+                    self._bump_clause(clause)
+                    self._assign(learnt[0], clause)
+
+                self.variable_increment /= self.variable_decay
+                self.clause_increment /= self.clause_decay
+                continue
+
+            if conflicts >= max_conflicts:
+                self._cancel(0)
+                return None
+            if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                self._reduce()
+
+            # Assumptions are decided first, one per decision level
+            literal = None
+            while len(self.limits) < len(assumptions):
+                assumption = assumptions[len(self.limits)]
+                if values[assumption] == 1:
+                    self.limits.append(len(self.trail))
+                elif values[assumption] == -1:
+                    return False
+                else:
+                    literal = assumption
+                    break
+
+            if literal is None:
+                literal = self._decision()
+                if literal is None:
+                    self.model = {self.terms[variable] if values[2 * variable] == 1 else ~self.terms[variable]
+                                  for variable in range(len(self.terms))}
+                    return True
+
+            self.limits.append(len(self.trail))
+            self._assign(literal, None)
+
+    def _assign(self, literal, reason):
+        variable = literal >> 1
+        self.values[literal] = 1
+        self.values[literal ^ 1] = -1
+        self.level[variable] = len(self.limits)
+        self.reason[variable] = reason
+        self.trail.append(literal)
+
+    def _watch(self, clause):
+        self.watches[clause.literals[0]].append(clause)
+        self.watches[clause.literals[1]].append(clause)
+
+    def _propagate(self):
+        """Unit propagation of the assignments on the trail not propagated yet; the conflicting clause, if any"""
+        values, watches, trail = self.values, self.watches, self.trail
+
+        while self.head < len(trail):
+            false = trail[self.head] ^ 1
+            self.head += 1
+            watching = watches[false]
+            kept = []
+
+            for i, clause in enumerate(watching):
+                literals = clause.literals
+                if literals[0] == false:
+                    literals[0], literals[1] = literals[1], false
+
+                first = literals[0]
+                if values[first] == 1:
+                    kept.append(clause)
+                    continue
+
+                for k in range(2, len(literals)):
+                    if values[literals[k]] != -1:
+                        literals[1], literals[k] = literals[k], false
+                        watches[literals[1]].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if values[first] == -1:
+                        kept += watching[i + 1:]
+                        watches[false] = kept
+                        self.head = len(trail)
+                        return clause
+
+                    self._assign(first, clause)
+
+            watches[false] = kept
+
+        return None
+
+    def _analyze(self, conflict):
+        """Learnt clause (asserting literal first, then one of the highest level) and backjump level"""
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        current = len(self.limits)
+        learnt = [None]
+        counter = 0
+        literal = None
+        index = len(trail) - 1
+        clause = conflict
+
+        while True:
+            if clause.learnt:
+                self._bump_clause(clause)
+
+            for other in clause.literals[0 if literal is None else 1:]:
+                variable = other >> 1
+                if not seen[variable] and level[variable] > 0:
+                    seen[variable] = 1
+                    self._bump_variable(variable)
+                    if level[variable] >= current:
+                        counter += 1
+                    else:
+                        learnt.append(other)
+
+            while not seen[trail[index] >> 1]:
+                index -= 1
+            literal = trail[index]
+            index -= 1
+            seen[literal >> 1] = 0
+            counter -= 1
+            if counter == 0:
+                break
+            clause = reason[literal >> 1]
+
+        learnt[0] = literal ^ 1
+
+        # Drop the literals implied by the others
+        minimized = learnt[:1]
+        for other in learnt[1:]:
+            clause = reason[other >> 1]
+            if clause is None or any(not seen[implied >> 1] and level[implied >> 1] > 0
+                                     for implied in clause.literals[1:]):
+                minimized.append(other)
+        for other in learnt[1:]:
+            seen[other >> 1] = 0
+
+        if len(minimized) == 1:
+            return minimized, 0
+
+        highest = max(range(1, len(minimized)), key=lambda i: level[minimized[i] >> 1])
+        minimized[1], minimized[highest] = minimized[highest], minimized[1]
+
+        return minimized, level[minimized[1] >> 1]
+
+    def _cancel(self, level):
+        """Backtracks to decision level `level`, saving the phases of the unassigned variables"""
+        if len(self.limits) <= level:
+            return
+
+        values, activity = self.values, self.activity
+        start = self.limits[level]
+        for literal in self.trail[start:]:
+            variable = literal >> 1
+            values[literal] = values[literal ^ 1] = 0
+            self.reason[variable] = None
+            self.phase[variable] = literal & 1
+            heapq.heappush(self.heap, (-activity[variable], variable))
+
+        del self.trail[start:]
+        del self.limits[level:]
+        self.head = len(self.trail)
+
+        if len(self.heap) > 4 * len(self.terms) + 1000:
+            self._rebuild_heap()
+
+    def _decision(self):
+        """Unassigned literal of highest activity, in its saved phase (`None` if every variable is assigned)"""
+        heap, values, activity = self.heap, self.values, self.activity
+        while heap:
+            priority, variable = heapq.heappop(heap)
+            if values[2 * variable] == 0 and -priority == activity[variable]:
+                return 2 * variable + self.phase[variable]
+
+        return None
+
+    def _rebuild_heap(self):
+        self.heap = [(-self.activity[variable], variable) for variable in range(len(self.terms))
+                     if self.values[2 * variable] == 0]
+        heapq.heapify(self.heap)
+
+    def _bump_variable(self, variable):
+        activity = self.activity
+        activity[variable] += self.variable_increment
+
+        if activity[variable] > 1e100:
+            for other in range(len(activity)):
+                activity[other] *= 1e-100
+            self.variable_increment *= 1e-100
+            self._rebuild_heap()
+        elif not self.values[2 * variable]:
+            heapq.heappush(self.heap, (-activity[variable], variable))
+
+    def _bump_clause(self, clause):
+        clause.activity += self.clause_increment
+
+        if clause.activity > 1e20:
+            for learnt in self.learnts:
+                learnt.activity *= 1e-20
+            self.clause_increment *= 1e-20
+
+    def _reduce(self):
+        """Deletes the less active half of the learnt clauses, except binary ones and reasons of assignments"""
+        self.learnts.sort(key=lambda clause: clause.activity)
+        half = len(self.learnts) // 2
+        kept = []
+
+        for i, clause in enumerate(self.learnts):
+            first = clause.literals[0]
+            locked = self.reason[first >> 1] is clause and self.values[first] == 1
+            if i < half and len(clause.literals) > 2 and not locked:
+                clause.deleted = True
+            else:
+                kept.append(clause)
+
+        self.learnts = kept
+        for i, watching in enumerate(self.watches):
+            self.watches[i] = [clause for clause in watching if not clause.deleted]
+
+
+def satisfiable(kb: KB, budget=None) -> bool:
+    """Whether the clauses of `kb` have a model"""
+    return Solver(kb, budget).solve()
+
+
+def entails(kb: KB, literal: Term, budget=None) -> bool:
+    """Propositional entailment check: kb ⊨? literal (i.e. whether kb ∧ ¬literal is unsatisfiable)"""
+    return not Solver(kb, budget).solve([~literal])
@@ -1,5 +1,38 @@
+import copy
+import pickle
+import threading
 import unittest
-from primitives import Literal, Clause
+
+from datalog import Datalog, datalog_solve
+from first_order import Relation, Function, RelationInstance, Var, FunctionInstance, ForAll, Exists
+from mente_parser import program, make_horn_kb
+from predicate import (Predicate, Clausification, solve, solve_iter, findall, Answers, Budget, Limit, subst_all,
+                       backward_chain_query, Tables, Bindings, unify, OccursCheck)
+from propositional import PackedKB, WatchIndex, forward_chaining_solve, watch_index
+from primitives import Literal, Clause, KB, HornClause, HornKB, KBBuilder, And, Or, Implies, Iff
+from sat import Solver, satisfiable, entails
+import prover
+from visitor import VariantVisitor, GlobalizeVisitor, NameSupply, visitor
+
+
+def path_kb(edges=(("a", "b"), ("b", "c"), ("c", "a"), ("c", "d"))):
+    """`HornKB` of `edge/2` facts between the given pairs of constants, with a left-recursive `path/2` over them"""
+    edge, path = Relation("edge"), Relation("path")
+    x, y, z = Var("X"), Var("Y"), Var("Z")
+    clauses = [HornClause({edge(Literal(a), Literal(b))}) for a, b in edges]
+    clauses += [HornClause({path(x, y), ~path(x, z), ~edge(z, y)}), HornClause({path(x, y), ~edge(x, y)})]
+
+    return HornKB(clauses)
+
+
+def pigeonhole_kb(holes):
+    """`KB` stating that `holes + 1` pigeons sit in `holes` holes, one per hole: unsatisfiable"""
+    placed = {(i, j): Literal(f"pigeon_{i}_hole_{j}") for i in range(holes + 1) for j in range(holes)}
+    clauses = [Clause({placed[i, j] for j in range(holes)}) for i in range(holes + 1)]
+    clauses += [Clause({~placed[i, j], ~placed[k, j]})
+                for j in range(holes) for i in range(holes + 1) for k in range(i + 1, holes + 1)]
+
+    return KB(clauses)
 
 
 class PropositionalLogicTestCase(unittest.TestCase):
@@ -20,3 +53,569 @@ class PropositionalLogicTestCase(unittest.TestCase):
         p2 = Clause({a})
 
         self.assertEqual(p - b, p2)
+
+    def test_kb_bulk_load(self):
+        a, b, c = Literal("a"), Literal("b"), Literal("c")
+        clauses = [HornClause({a}), HornClause({b, ~a}), HornClause({a}), Clause({c, ~b})]
+
+        kb = HornKB.from_iterable(clause for clause in clauses)
+        builder = KBBuilder(HornKB)
+        for clause in clauses:
+            builder += clause
+
+        self.assertEqual(kb.clauses, (HornClause({a}), HornClause({b, ~a}), HornClause({c, ~b})))
+        self.assertEqual(builder.build().clauses, kb.clauses)
+        self.assertEqual((kb + HornKB([HornClause({c}), HornClause({a})])).clauses, kb.clauses + (HornClause({c}),))
+        self.assertEqual(kb.candidates(c), [HornClause({c, ~b})])
+
+    def test_forward_chaining(self):
+        p, q, r, s, t = [Literal(name) for name in "pqrst"]
+        kb = HornKB([HornClause({q, ~p}), HornClause({r, ~p, ~q}), HornClause({s, ~t}), HornClause({t, ~s}),
+                     HornClause({p})])
+
+        self.assertTrue(forward_chaining_solve(kb, r))
+        self.assertFalse(forward_chaining_solve(kb, s))
+        self.assertFalse(forward_chaining_solve(kb, Literal("missing")))
+        self.assertIs(watch_index(kb), watch_index(kb))
+        with self.assertRaises(TypeError):
+            WatchIndex(PackedKB([Clause({p, q, ~r})]))
+
+    def test_packed_kb(self):
+        a, b, c = Literal("a"), Literal("b"), Literal("c")
+        kb = KB([Clause({a, ~b}), Clause({a, ~b, c}), Clause({~a})])
+
+        packed = PackedKB.from_kb(kb)
+
+        self.assertEqual(packed[1], tuple(sorted(packed[1])))
+        self.assertEqual(packed.unpack(packed[1]), Clause({a, ~b, c}))
+        self.assertEqual(packed.to_kb().clauses, kb.clauses)
+        self.assertEqual(packed.unpack(PackedKB.unit_resolution(packed[1], packed[2][0])), Clause({~b, c}))
+        self.assertTrue(packed.subsumes(0, 1))
+        self.assertFalse(packed.subsumes(1, 0))
+        self.assertFalse(packed.subsumes(2, 1))
+        with self.assertRaises(TypeError):
+            packed.add(Clause({Relation("p")(Var("X"))}))
+        with self.assertRaises(ValueError):
+            packed.add([1, -4])
+        with self.assertRaises(ValueError):
+            packed.add([0])
+        self.assertEqual(packed[packed.add([-3, 2])], (-3, 2))
+
+    def test_interned_terms(self):
+        connected = Relation("connected")
+
+        self.assertIs(Literal("a"), Literal("a"))
+        self.assertIsNot(Literal("a"), ~Literal("a"))
+        self.assertIs(connected(Literal("a"), Var("X")), connected(Literal("a"), Var("X")))
+        self.assertIs(~connected(Literal("a"), Var("X")),
+                      RelationInstance("connected", Literal("a"), Var("X"), negate=True))
+        self.assertNotEqual(connected(Literal("a"), Var("X")), connected(Literal("b"), Var("X")))
+
+    def test_copy_interned_terms(self):
+        connected, line = Relation("connected"), Function("line")
+        terms = [Literal("a"), ~Literal("a"), Var("X"), ~connected(Literal("a"), line(Var("X"))), ~line(Literal("b"))]
+
+        for term in terms:
+            self.assertIs(copy.copy(term), term)
+            self.assertIs(copy.deepcopy(term), term)
+            self.assertIs(pickle.loads(pickle.dumps(term)), term)
+
+    def test_copy_terms(self):
+        a, b, c, x = Literal("a"), Literal("b"), Literal("c"), Var("X")
+        clause = HornClause({a, ~b, ~c}, body=[~c, ~b])
+        formula = And(Or(a, ~b), ForAll(x, Implies(Relation("p")(x), c)))
+        kb = HornKB([clause, HornClause({b})])
+
+        for copied in [copy.copy, copy.deepcopy, lambda term: pickle.loads(pickle.dumps(term))]:
+            self.assertEqual(copied(clause), clause)
+            self.assertEqual(copied(clause).body, clause.body)
+            self.assertEqual(str(copied(formula)), str(formula))
+            self.assertEqual(copied(kb).clauses, kb.clauses)
+            self.assertEqual(copied(kb).candidates(b), [kb.clauses[1]])
+
+    def test_visitor_dispatch_fallback(self):
+        class TermVisitor:
+            @visitor(Clause)
+            def visit(self, _):
+                return "clause"
+
+            @visitor(Literal)
+            def visit(self, _):
+                return "literal"
+
+        class LiteralVisitor(TermVisitor):
+            @visitor(Literal)
+            def visit(self, _):
+                return "overridden literal"
+
+        self.assertEqual(TermVisitor().visit(HornClause({Literal("a")})), "clause")
+        self.assertEqual(LiteralVisitor().visit(Literal("a")), "overridden literal")
+        self.assertEqual(LiteralVisitor().visit(Clause({Literal("a")})), "clause")
+        self.assertRaises(KeyError, TermVisitor().visit, Var("X"))
+
+
+class BackwardChainingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        connected = Relation("connected")
+        nearby = Relation("nearby")
+        x, y, line = Var("X"), Var("Y"), Var("L")
+
+        self.facts = [HornClause({connected(Literal(a), Literal(b), Literal(line))})
+                      for a, b, line in [("bond_street", "oxford_circus", "central"),
+                                         ("oxford_circus", "tottenham_court_road", "central"),
+                                         ("bond_street", "green_park", "jubilee")]]
+        self.rule = HornClause({nearby(x, y), ~connected(x, y, line)})
+        self.kb = HornKB(self.facts + [self.rule])
+
+    def test_index_first_argument(self):
+        connected = Relation("connected")
+        goal = connected(Literal("bond_street"), Var("Q"), Var("R"))
+
+        self.assertEqual(self.kb.candidates(goal), [self.facts[0], self.facts[2]])
+
+    def test_index_variable_first_argument(self):
+        connected = Relation("connected")
+        goal = connected(Var("P"), Literal("green_park"), Var("R"))
+
+        self.assertEqual(self.kb.candidates(goal), self.facts)
+        self.assertEqual(self.kb.candidates(Relation("missing")(Var("P"))), [])
+
+    def test_solve(self):
+        nearby = Relation("nearby")
+        query = HornClause({nearby(Literal("oxford_circus"), Var("P"))})
+
+        result = solve(self.kb, query)
+
+        self.assertEqual(result.terms, [nearby(Literal("oxford_circus"), Literal("tottenham_court_road"))])
+
+    def test_dependency_graph(self):
+        p, l, m, a = Literal("p"), Literal("l"), Literal("m"), Literal("a")
+        kb = HornKB([HornClause({p, ~l, ~m}), HornClause({l, ~a, ~p}), HornClause({m}), HornClause({a})])
+
+        self.assertEqual(set(kb.dependencies.component(p.functor())), {p.functor(), l.functor()})
+        self.assertFalse(kb.dependencies.is_recursive(m.functor()))
+        self.assertFalse(self.kb.dependencies.is_recursive(p.functor()))
+
+    def test_cycle_detection(self):
+        p, l, a = Literal("p"), Literal("l"), Literal("a")
+        kb = HornKB([HornClause({p, ~l}), HornClause({l, ~a, ~p}), HornClause({a})])
+
+        with self.assertRaises(RuntimeError):
+            solve(kb, HornClause({p}))
+
+    def test_productive_recursion(self):
+        nat, s = Relation("nat"), Function("s")
+        x, y, z = Var("X"), Var("Y"), Literal("z")
+        kb = HornKB([HornClause({nat(z)}), HornClause({nat(s(x)), ~nat(x)})])
+
+        answers = [answer.terms[0] for answer in solve_iter(kb, HornClause({nat(y)}), limit=3)]
+
+        self.assertEqual(answers, [nat(z), nat(s(z)), nat(s(s(z)))])
+
+    def test_tabled_left_recursion(self):
+        path, w = Relation("path"), Var("W")
+        a, b, c, d = Literal("a"), Literal("b"), Literal("c"), Literal("d")
+        kb = path_kb()
+        tables = Tables({("path", 2)})
+        query = HornClause({path(a, w)})
+
+        answers = {subst_all(query.head, subst) for subst in backward_chain_query(kb, query, tables)}
+
+        self.assertEqual(answers, {path(a, a), path(a, b), path(a, c), path(a, d)})
+        self.assertIn(VariantVisitor().visit(query.head), tables.complete)
+
+    def test_bindings_trail(self):
+        x, y = Var("X"), Var("Y")
+        a, b = Literal("a"), Literal("b")
+        f = Relation("f")
+        subst = Bindings()
+        mark = subst.mark()
+
+        self.assertIs(unify(f(x, a), f(y, y), subst), subst)
+        self.assertEqual(subst.deref(x), a)
+        self.assertIsNone(unify(x, b, subst))
+        self.assertIsNone(unify(x, f(x), Bindings()))
+        self.assertEqual(subst_all(f(x, y), subst), f(a, a))
+
+        subst.undo(mark)
+        self.assertEqual(len(subst), 0)
+
+    def test_unify_large_terms(self):
+        f, cons = Relation("f"), Relation("list")
+        a, x = Literal("a"), Var("X")
+
+        wide_vars = [Var(f"X{i}") for i in range(2000)]
+        subst = unify(f(*wide_vars), f(*[a] * 2000), Bindings())
+        self.assertEqual({subst.deref(var) for var in wide_vars}, {a})
+
+        deep_x, deep_a = x, a
+        for _ in range(5000):
+            deep_x, deep_a = cons(a, deep_x), cons(a, deep_a)
+        subst = unify(deep_x, deep_a, Bindings())
+        self.assertEqual(subst.deref(x), a)
+
+    def test_occurs_check_modes(self):
+        f, x = Relation("f"), Var("X")
+
+        self.assertIsNone(unify(x, f(x), Bindings(OccursCheck.ALWAYS)))
+        self.assertIsNotNone(unify(x, f(x), Bindings(OccursCheck.NEVER)))
+        self.assertIsNotNone(unify(x, f(x), Bindings(OccursCheck.HEADS)))
+        self.assertIsNone(unify(x, f(x), Bindings(OccursCheck.HEADS), head=True))
+
+    def test_subst_all_single_pass(self):
+        f, g = Relation("f"), Relation("g")
+        x, y, z = Var("X"), Var("Y"), Var("Z")
+        a = Literal("a")
+        ground = g(a, a)
+        subst = Bindings()
+        unify(x, f(y, z), subst)
+        unify(y, a, subst)
+
+        term = f(ground, x, z)
+        result = subst_all(term, subst)
+
+        self.assertEqual(result, f(ground, f(a, z), z))
+        self.assertIs(result.vars[0], ground)
+        self.assertIs(subst_all(term, Bindings()), term)
+
+    def test_subst_all_cyclic_binding(self):
+        f, x = Relation("f"), Var("X")
+        subst = unify(x, f(x), Bindings(OccursCheck.NEVER))
+
+        with self.assertRaises(RuntimeError):
+            subst_all(f(x), subst)
+
+    def test_make_horn_kb(self):
+        source = "connected(a, b, l). reachable(X, Y, []) :- connected(X, Y, L). " \
+                 "reachable(X, Y, [Z, R]) :- connected(X, Z, L), reachable(Z, Y, R)."
+        kb = make_horn_kb(program.parseString(source, parseAll=True)["statements"])
+        connected, reachable, cons = Relation("connected"), Relation("reachable"), Relation("list")
+        x, y, z, r, line = [Var(f"{name}#2") for name in ["X", "Y", "Z", "R", "L"]]
+
+        self.assertEqual(len(kb.clauses), 3)
+        self.assertEqual(kb.clauses[1].head, reachable(Var("X#1"), Var("Y#1"), cons()))
+        self.assertEqual(kb.clauses[2], HornClause({reachable(x, y, cons(z, r)), ~connected(x, z, line),
+                                                    ~reachable(z, y, r)}))
+
+        query = HornClause({reachable(Literal("a"), Var("Y"), Var("R"))})
+        self.assertEqual(solve(kb, query).terms, [reachable(Literal("a"), Literal("b"), cons())])
+
+    def test_horn_clause_body_order(self):
+        p, q, r = Relation("p"), Relation("q"), Relation("r")
+        x, y, a = Var("X"), Var("Y"), Literal("a")
+        body = [~r(x), ~q(x, y), ~p(y)]
+        clause = HornClause({p(x)} | set(body), body=body)
+        subst = unify(x, a, Bindings())
+
+        self.assertEqual(subst_all(clause, subst).body, [~r(a), ~q(a, y), ~p(y)])
+        with self.assertRaises(TypeError):
+            HornClause({p(x), ~q(x, y), ~r(x)}, body=[~q(x, y)])
+        with self.assertRaises(TypeError):
+            HornClause({p(x), ~q(x, y)}, body=[~q(x, y), ~q(x, y)])
+
+    def test_recursive_rule_renaming(self):
+        source = "connected(a, b, l). connected(b, c, l). connected(c, d, m). " \
+                 "reachable(X, Y, []) :- connected(X, Y, L). " \
+                 "reachable(X, Y, [Z, R]) :- connected(X, Z, L), reachable(Z, Y, R)."
+        kb = make_horn_kb(program.parseString(source, parseAll=True)["statements"])
+        reachable, cons = Relation("reachable"), Relation("list")
+        a, b, c, d = Literal("a"), Literal("b"), Literal("c"), Literal("d")
+
+        query = HornClause({reachable(a, d, Var("R"))})
+        self.assertEqual(solve(kb, query).terms, [reachable(a, d, cons(b, cons(c, cons())))])
+
+    def test_unify_frames(self):
+        f, x, y, a = Relation("f"), Var("X"), Var("Y"), Literal("a")
+        subst = Bindings()
+        first, second = subst.frame(), subst.frame()
+
+        self.assertIs(unify(f(x, a), f(a, x), subst, x_frame=first, y_frame=second), subst)
+        self.assertEqual(subst.deref(x, first), a)
+        self.assertEqual(subst.deref(x, second), a)
+        self.assertNotIn(x, subst)
+        self.assertEqual(subst_all(f(x, y), subst, first), f(a, Var(f"Y@{first}")))
+
+    def test_solve_iter(self):
+        connected = Relation("connected")
+        bond_street, p, line = Literal("bond_street"), Var("P"), Var("L")
+        query = HornClause({connected(bond_street, p, line)})
+
+        answers = [answer.terms[0].vars[1] for answer in solve_iter(self.kb, query)]
+        self.assertEqual(answers, [Literal("oxford_circus"), Literal("green_park")])
+        self.assertEqual([answer.terms for answer in solve_iter(self.kb, query, limit=1, offset=1)],
+                         [[connected(bond_street, Literal("green_park"), Literal("jubilee"))]])
+        self.assertEqual(findall(self.kb, query, offset=2), [])
+
+        station = Relation("station")
+        kb = self.kb + HornKB([HornClause({station(p), ~connected(p, Var("Q"), line)})])
+        self.assertEqual(len(findall(kb, HornClause({station(bond_street)}))), 2)
+        self.assertEqual(len(findall(kb, HornClause({station(bond_street)}), distinct=True)), 1)
+
+    def test_answers_paging(self):
+        connected = Relation("connected")
+        query = HornClause({connected(Var("X"), Var("Y"), Var("L"))})
+        answers = Answers(self.kb, query)
+
+        self.assertEqual(len(answers.page(2)), 2)
+        self.assertEqual(answers.position, 2)
+        self.assertEqual([answer.terms for answer in answers.page(2)], [list(self.facts[2].terms)])
+        self.assertTrue(answers.exhausted)
+
+        budget = Budget(steps=2)
+        answers = Answers(self.kb, query, budget=budget)
+        self.assertEqual(len(answers.page(3)), 2)
+        self.assertEqual(answers.page(3), [])
+        self.assertEqual(budget.exceeded, Limit.STEPS)
+        self.assertFalse(answers.exhausted)
+
+    def test_budget(self):
+        count, s = Relation("count"), Relation("s")
+        x = Var("X")
+        kb = HornKB([HornClause({count(x), ~count(s(x))})])
+        query = HornClause({count(Literal("z"))})
+
+        budget = Budget(steps=100)
+        self.assertIsNone(solve(kb, query, budget=budget))
+        self.assertEqual((budget.exceeded, budget.steps), (Limit.STEPS, 101))
+
+        budget = Budget(timeout=0, interval=16)
+        self.assertEqual(findall(kb, query, budget=budget), [])
+        self.assertEqual(budget.exceeded, Limit.DEADLINE)
+
+        cancel = threading.Event()
+        cancel.set()
+        budget = Budget(cancel=cancel, interval=1)
+        self.assertIsNone(solve(kb, query, budget=budget))
+        self.assertEqual(budget.exceeded, Limit.CANCELLED)
+
+        query = HornClause({Relation("path")(Literal("a"), Var("Y"))})
+        budget = Budget(timeout=0, interval=10 ** 9)
+        self.assertIsNone(solve(path_kb([("a", "b")]), query, Tables({("path", 2)}), budget=budget))
+        self.assertEqual(budget.exceeded, Limit.DEADLINE)
+
+        budget = Budget(steps=100)
+        self.assertEqual(len(findall(self.kb, HornClause({Relation("connected")(x, Var("Y"), Var("L"))}),
+                                     budget=budget)), 3)
+        self.assertIsNone(budget.exceeded)
+
+    def test_deep_proof(self):
+        next_, path = Relation("next"), Relation("path")
+        x, y, z = Var("X"), Var("Y"), Var("Z")
+        n = 3000
+        clauses = [HornClause({next_(Literal(f"s{i}"), Literal(f"s{i + 1}"))}) for i in range(n)]
+        clauses += [HornClause({path(x, y), ~next_(x, z), ~path(z, y)}, body=[~next_(x, z), ~path(z, y)]),
+                    HornClause({path(x, y), ~next_(x, y)})]
+        kb = HornKB(clauses)
+
+        query = HornClause({path(Literal("s0"), Literal(f"s{n}"))})
+        self.assertEqual(solve(kb, query).terms, [query.head])
+        self.assertEqual(len(findall(kb, HornClause({path(Literal("s0"), Var("W"))}))), n)
+
+    def test_propositionalize_long_conjunction(self):
+        connected = Relation("connected")
+        facts = [HornClause({connected(Literal(f"s{i}"), Literal(f"s{i + 1}"))}) for i in range(3000)]
+        formula = facts[-1]
+        for fact in reversed(facts[:-1]):
+            formula = And(fact, formula)
+
+        clauses = Predicate(formula).propositionalize().components
+
+        self.assertEqual(set(clauses), {Clause(fact.terms) for fact in facts})
+        self.assertEqual(len(Predicate(facts).propositionalize().components), 3000)
+
+    def test_propositionalize_quantifiers(self):
+        p, q = Relation("p"), Relation("q")
+        x, y = Var("X"), Var("Y")
+        formula = And(ForAll(x, Exists(y, Implies(p(x), q(x, y)))), Exists(x, ~Or(p(x), Literal("a"))))
+
+        clauses = Predicate(formula).propositionalize().components
+
+        skolem = FunctionInstance("skolem_0", x)
+        self.assertEqual(set(clauses), {Clause({~p(x), q(x, skolem)}), Clause({~p(Var("x0"))}),
+                                        Clause({~Literal("a")})})
+
+    def test_globalize_per_compilation(self):
+        p, q = Relation("p"), Relation("q")
+        x = Var("X")
+        formula = And(ForAll(x, And(p(x), Exists(x, q(x)))), Exists(x, p(x)))
+        expected = And(ForAll(x, And(p(x), Exists(Var("x0"), q(Var("x0"))))), Exists(Var("x1"), p(Var("x1"))))
+
+        self.assertEqual(str(GlobalizeVisitor().visit(formula)), str(expected))
+        self.assertEqual(str(GlobalizeVisitor().visit(formula)), str(expected))
+
+    def test_free_variables_reserved(self):
+        p, q = Relation("p"), Relation("q")
+        x = Var("X")
+        formula = Or(p(x), ForAll(x, q(x)))
+
+        clauses = Predicate(formula).propositionalize().components
+        globalized = GlobalizeVisitor(NameSupply().reserve(formula)).visit(formula)
+
+        self.assertEqual(clauses, (Clause({p(x), q(Var("x0"))}),))
+        self.assertEqual(str(globalized), str(Or(p(x), ForAll(Var("x0"), q(Var("x0"))))))
+
+    def test_propositionalize_definitions(self):
+        pairs = [(Literal(f"a{i}"), Literal(f"b{i}")) for i in range(30)]
+        formula = And(*pairs[0])
+        for a, b in pairs[1:]:
+            formula = Or(formula, And(a, b))
+
+        clauses = Predicate(formula).propositionalize(Clausification.DEFINITIONS).components
+
+        definitions = clauses[0].terms
+        self.assertEqual(len(clauses), 1 + 2 * 30)
+        self.assertEqual(len(definitions), 30)
+        self.assertTrue(all(definition.name.startswith("definition#") for definition in definitions))
+        self.assertTrue(any(Clause({~definition, pairs[0][0]}) in clauses for definition in definitions))
+
+    def test_propositionalize_definitions_free_vars(self):
+        p, x, y = Relation("p"), Var("X"), Var("Y")
+        formula = ForAll(x, Or(p(x), And(p(y), Literal("c"))))
+
+        clauses = Predicate(formula).propositionalize(Clausification.DEFINITIONS).components
+
+        definition = next(term for term in clauses[0].terms if term.functor()[0].startswith("definition#"))
+        self.assertEqual(definition.vars, (y,))
+        self.assertEqual(set(clauses), {Clause({p(x), definition}), Clause({~definition, p(y)}),
+                                        Clause({~definition, Literal("c")})})
+
+    def test_propositionalize_definitions_names(self):
+        a, b, c = Literal("a"), Literal("b"), Literal("c")
+        user = Literal("definition_0")
+        formula = Or(user, And(a, b))
+
+        first = Predicate(formula).propositionalize(Clausification.DEFINITIONS).components
+        second = Predicate(Or(c, And(a, b))).propositionalize(Clausification.DEFINITIONS).components
+
+        first_definition = next(term for term in first[0].terms if term is not user)
+        second_definition = next(term for term in second[0].terms if term is not c)
+        self.assertIn(user, first[0].terms)
+        self.assertIsNot(first_definition, user)
+        self.assertIsNot(first_definition, second_definition)
+
+    def test_propositionalize_negated_connectives(self):
+        a, b = Literal("a"), Literal("b")
+
+        self.assertEqual(set(Predicate(~Implies(a, b)).propositionalize().components), {Clause({a}), Clause({~b})})
+        self.assertEqual(set(Predicate(Iff(a, b)).propositionalize().components),
+                         {Clause({~a, b}), Clause({~b, a})})
+
+
+class DatalogTestCase(unittest.TestCase):
+
+    def test_transitive_closure(self):
+        path = Relation("path")
+        a, b, c, d = Literal("a"), Literal("b"), Literal("c"), Literal("d")
+        kb = path_kb()
+
+        model = Datalog(kb)
+
+        self.assertEqual(set(model.query(path(a, Var("W")))), {path(a, a), path(a, b), path(a, c), path(a, d)})
+        self.assertEqual(set(datalog_solve(kb, path(Var("W"), d))), {path(a, d), path(b, d), path(c, d)})
+        self.assertNotIn(path(d, a), model)
+        self.assertEqual(len(model), 4 + 3 * 4)
+        self.assertEqual(set(model.query(path(Var("W"), Var("W")))), {path(a, a), path(b, b), path(c, c)})
+
+    def test_propositional_rules(self):
+        p, q, r = Literal("p"), Literal("q"), Literal("r")
+        edge = Relation("edge")
+        kb = HornKB([HornClause({edge(p, q)}), HornClause({q, ~edge(Var("X"), Var("Y"))}), HornClause({r, ~p})])
+
+        model = Datalog(kb)
+
+        self.assertIn(q, model)
+        self.assertNotIn(r, model)
+
+    def test_rejects_non_datalog(self):
+        p, cons = Relation("p"), Relation("list")
+        x, y = Var("X"), Var("Y")
+
+        with self.assertRaises(TypeError):
+            Datalog(HornKB([HornClause({p(cons(x))})]))
+        with self.assertRaises(TypeError):
+            Datalog(HornKB([HornClause({p(x, y), ~p(x, x)})]))
+
+
+class SatTestCase(unittest.TestCase):
+
+    def test_entails_non_horn(self):
+        a, b, c = Literal("a"), Literal("b"), Literal("c")
+        kb = KB([Clause({a, b}), Clause({~a, c}), Clause({~b, c})])
+
+        self.assertTrue(satisfiable(kb))
+        self.assertTrue(entails(kb, c))
+        self.assertFalse(entails(kb, a))
+
+        solver = Solver(kb)
+        self.assertTrue(solver.solve([~a]))
+        self.assertTrue({~a, b, c} <= solver.model)
+
+    def test_pigeonhole(self):
+        kb = pigeonhole_kb(5)
+
+        self.assertFalse(satisfiable(kb))
+        self.assertTrue(satisfiable(KB(kb.clauses[1:])))
+
+    def test_restarts_backtrack(self):
+        solver = Solver(pigeonhole_kb(5), restart_base=1)
+        levels = []
+        search = solver._search
+
+        def traced(max_conflicts, assumptions):
+            levels.append(len(solver.limits))
+            return search(max_conflicts, assumptions)
+
+        solver._search = traced
+        self.assertFalse(solver.solve())
+        self.assertGreater(len(levels), 1)
+        self.assertEqual(set(levels), {0})
+
+
+class ProverTestCase(unittest.TestCase):
+
+    def test_disjunctive_kb(self):
+        p, q, r = Relation("p"), Relation("q"), Relation("r")
+        x, a = Var("X"), Literal("a")
+        kb = KB([Clause({p(x), q(x)}), Clause({~p(x), r(x)}), Clause({~q(x), r(x)})])
+
+        self.assertTrue(prover.entails(kb, r(a)))
+        self.assertTrue(prover.entails(kb, Clause({p(a), q(a)})))
+        self.assertFalse(prover.entails(kb, p(a)))
+
+    def test_propositionalized_kb(self):
+        man, mortal = Relation("man"), Relation("mortal")
+        x, socrates = Var("X"), Literal("socrates")
+        clauses = Predicate(And(ForAll(x, Implies(man(x), mortal(x))), man(socrates))).propositionalize().components
+
+        self.assertTrue(prover.entails(KB(list(clauses)), mortal(Var("Y"))))
+        self.assertFalse(prover.entails(KB(list(clauses)), mortal(Literal("plato"))))
+
+    def test_budget(self):
+        kb = pigeonhole_kb(4)
+
+        self.assertIsNone(prover.entails(kb, Literal("false"), Budget(steps=100)))
+        self.assertTrue(prover.entails(kb, Literal("false")))
+
+    def test_preprocess(self):
+        p, q = Relation("p"), Relation("q")
+        x, a, b = Var("X"), Literal("a"), Literal("b")
+        kb = KB([Clause({p(a), q(a)}), Clause({p(x), q(x)}), Clause({p(a), ~p(a)}), Clause({p(x), q(x)}),
+                 Clause({q(b), p(a)}), Clause({q(b)})])
+
+        simplified, removed = prover.preprocess(kb)
+
+        self.assertEqual(simplified.clauses, (Clause({p(x), q(x)}), Clause({q(b)})))
+        self.assertEqual(removed, prover.Removed(tautologies=1, duplicates=1, subsumed=2))
+
+    def test_preprocess_horn_kb(self):
+        p, q = Relation("p"), Relation("q")
+        x, a = Var("X"), Literal("a")
+        kb = HornKB([HornClause({p(a)}), HornClause({q(x), ~p(x)}), HornClause({q(a), ~p(a)}),
+                     HornClause({q(x), ~p(x), ~p(a)}, body=[~p(a), ~p(x)])])
+
+        simplified, removed = prover.preprocess(kb)
+
+        self.assertIsInstance(simplified, HornKB)
+        self.assertEqual(simplified.clauses, kb.clauses[:2])
+        self.assertEqual(removed, prover.Removed(subsumed=2))
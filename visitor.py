@@ -1,4 +1,6 @@
-from collections import Counter
+import itertools
+import threading
+from collections import Counter, defaultdict, deque
 
 from first_order import Var, Exists, ForAll, RelationInstance, Quantifier, Function, FunctionInstance
 from primitives import Literal, And, Or, FreeClause, Operator, Clause, KB, Implies, Iff, HornClause
@@ -15,17 +17,38 @@ def _declaring_class(obj):
     return name[:name.rfind('.')]
 
 
-# Stores the actual visitor methods
+# Stores the actual visitor methods, by declaring class name and argument type
 _methods = {}
 
+# Dispatch tables (argument type -> method) of each visitor class, filled in lazily on the first visit of a type
+_tables = {}
+
 
 # Delegating visitor implementation
 def _visitor_impl(self, arg):
     """Actual visitor method implementation."""
-    method = _methods[(_qualname(type(self)), type(arg))]
+    table = _tables.get(type(self))
+    if table is None:
+        table = _tables[type(self)] = {}
+
+    method = table.get(type(arg))
+    if method is None:
+        method = table[type(arg)] = _resolve(type(self), type(arg))
+
     return method(self, arg)
 
 
+def _resolve(cls, arg_type):
+    """Find the visitor method of `cls` (or of its base classes) for `arg_type` (or for its closest base class)."""
+    for base in arg_type.__mro__:
+        for klass in cls.__mro__:
+            method = _methods.get((_qualname(klass), base))
+            if method is not None:
+                return method
+
+    raise KeyError((_qualname(cls), arg_type))
+
+
 # The actual @visitor decorator
 def visitor(arg_type):
     """Decorator that creates a visitor method."""
@@ -33,6 +56,7 @@ def visitor(arg_type):
     def decorator(fn):
         declaring_class = _declaring_class(fn)
         _methods[(declaring_class, arg_type)] = fn
+        _tables.clear()
 
         # Replace all decorated methods with _visitor_impl
         return _visitor_impl
@@ -40,6 +64,69 @@ def visitor(arg_type):
     return decorator
 
 
+class NameSupply:
+    """Fresh names for a single compilation: variables bound by quantifiers keep their name the first time
+    it is seen and get `x0`, `x1`, ... afterwards; Skolem functions are numbered per prefix (see `symbol` for
+    definition atoms).
+    Every compilation should use its own supply (visitors create one unless given one)"""
+
+    def __init__(self):
+        self.bound = set()
+        self.counters = Counter()
+
+    def reserve(self, formula):
+        """Reserves the names of the free variables of `formula`, so that no bound variable gets one of them
+        (else it would be merged with the free variable once quantifiers are dropped). Returns the supply"""
+        todo = [(formula, frozenset())]
+        while todo:
+            term, bound = todo.pop()
+
+            if type(term) is Var:
+                if term not in bound:
+                    self.bound.add(term.name)
+            elif isinstance(term, Quantifier):
+                todo.append((term.predicate, bound | {term.variable}))
+            elif isinstance(term, Operator):
+                todo += [(term.operand1, bound), (term.operand2, bound)]
+            elif isinstance(term, (FreeClause, Clause)):
+                todo += [(child, bound) for child in term.terms]
+            elif type(term) is RelationInstance:
+                todo += [(arg, bound) for arg in term.vars]
+            elif type(term) is FunctionInstance:
+                todo.append((term.arg, bound))
+
+        return self
+
+    def variable(self, var):
+        """Name for a variable bound by a quantifier, distinct from every other bound variable
+        (and from the free variables reserved with `reserve`)"""
+        name = var.name
+        while name in self.bound:
+            name = self.fresh("x", "")
+        self.bound.add(name)
+
+        return Var(name)
+
+    def fresh(self, prefix, separator="_"):
+        """Next name of the form `<prefix><separator><n>`"""
+        name = f"{prefix}{separator}{self.counters[prefix]}"
+        self.counters[prefix] += 1
+
+        return name
+
+    # Shared by every supply, see `symbol`
+    _symbols = defaultdict(itertools.count)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def symbol(prefix):
+        """Name of the form `<prefix>#<n>` for a symbol introduced by the compilation (e.g. a definition atom).
+        `#` can't appear in parsed names, and `n` is unique across every supply, so the symbol can't clash
+        with a name of the input nor with a symbol of another compilation whose clauses are merged with these"""
+        with NameSupply._lock:
+            return f"{prefix}#{next(NameSupply._symbols[prefix])}"
+
+
 class GroundVisitor:
     @visitor(Literal)
     def visit(self, _):
@@ -239,9 +326,12 @@ class FreeVarVisitor:
         return self.visit(function.arg)
 
 
-class GlobalizeVisitor:
-    i = 0
-    var_visitor = VarVisitor()
+class VariantVisitor:
+    """Renames variables in order of appearance, so that terms which are variants of each other
+    (equal up to variable renaming) are mapped to the same term"""
+
+    def __init__(self):
+        self.names = {}
 
     @visitor(Literal)
     def visit(self, literal):
@@ -249,55 +339,79 @@ class GlobalizeVisitor:
 
     @visitor(Var)
     def visit(self, var):
-        return var
+        if var not in self.names:
+            self.names[var] = Var(f"_{len(self.names)}")
 
-    @visitor(And)
-    def visit(self, operator: And):
-        vars = self.var_visitor.visit(operator.operand1) + self.var_visitor.visit(operator.operand2)
-        counter = Counter(vars)
-        dups = [var for var in vars if counter[var] > 1]
+        return self.names[var]
 
-        op1 = operator.operand1
-        op2 = operator.operand2
+    @visitor(RelationInstance)
+    def visit(self, relation: RelationInstance):
+        vars = [self.visit(var) for var in relation.vars]
 
-        for var in set(dups):
-            new_var = Var(f"x{self.i}")
-            subst_visitor = SubstVisitor(var, new_var)
-            op1 = subst_visitor.visit(op1)
-            self.i += 1
+        return RelationInstance(relation.relation_name, *vars, negate=relation.negate)
 
-            new_var = Var(f"x{self.i}")
-            subst_visitor = SubstVisitor(var, new_var)
-            op2 = subst_visitor.visit(op2)
-            self.i += 1
+    @visitor(FunctionInstance)
+    def visit(self, function: FunctionInstance):
+        arg = self.visit(function.arg)
 
-        op1 = self.visit(op1)
-        op2 = self.visit(op2)
+        return FunctionInstance(function.function_name, arg, function.negate)
 
-        return And(op1, op2, operator.negate)
 
-    @visitor(Or)
-    def visit(self, operator):
-        vars = self.var_visitor.visit(operator.operand1) + self.var_visitor.visit(operator.operand2)
-        counter = Counter(vars)
-        dups = [var for var in vars if counter[var] > 1]
+class RenameVisitor:
+    """Renames variables all at once, as given by `names` (a dict from `Var` to `Var`)"""
 
-        op1 = operator.operand1
-        op2 = operator.operand2
+    def __init__(self, names):
+        self.names = names
 
-        for var in set(dups):
-            new_var = Var(f"x{self.i}")
-            subst_visitor = SubstVisitor(var, new_var)
-            op1 = subst_visitor.visit(op1)
-            self.i += 1
+    @visitor(Literal)
+    def visit(self, literal):
+        return literal
+
+    @visitor(Var)
+    def visit(self, var):
+        return self.names.get(var, var)
+
+    @visitor(RelationInstance)
+    def visit(self, relation: RelationInstance):
+        vars = [self.visit(var) for var in relation.vars]
 
-            new_var = Var(f"x{self.i}")
-            subst_visitor = SubstVisitor(var, new_var)
-            op2 = subst_visitor.visit(op2)
-            self.i += 1
+        return RelationInstance(relation.relation_name, *vars, negate=relation.negate)
 
-        op1 = self.visit(op1)
-        op2 = self.visit(op2)
+    @visitor(FunctionInstance)
+    def visit(self, function: FunctionInstance):
+        arg = self.visit(function.arg)
+
+        return FunctionInstance(function.function_name, arg, function.negate)
+
+
+class GlobalizeVisitor:
+    """Standardizes apart the variables bound by quantifiers, in a single pass: each quantifier gets a variable
+    from `names` (see `NameSupply`), and occurrences in its scope are renamed along the way.
+    The free variables of the formula must be reserved in `names` first (see `NameSupply.reserve`)"""
+
+    def __init__(self, names=None):
+        self.names = names or NameSupply()
+        self.scope = {}
+
+    @visitor(Literal)
+    def visit(self, literal):
+        return literal
+
+    @visitor(Var)
+    def visit(self, var):
+        return self.scope.get(var, var)
+
+    @visitor(And)
+    def visit(self, operator: And):
+        op1 = self.visit(operator.operand1)
+        op2 = self.visit(operator.operand2)
+
+        return And(op1, op2, operator.negate)
+
+    @visitor(Or)
+    def visit(self, operator):
+        op1 = self.visit(operator.operand1)
+        op2 = self.visit(operator.operand2)
 
         return Or(op1, op2, operator.negate)
 
@@ -313,19 +427,39 @@ class GlobalizeVisitor:
 
     @visitor(Exists)
     def visit(self, quantifier: Quantifier):
-        return quantifier
+        variable, predicate = self._scoped(quantifier)
+
+        return Exists(variable, predicate, quantifier.negate)
 
     @visitor(ForAll)
     def visit(self, quantifier):
-        return quantifier
+        variable, predicate = self._scoped(quantifier)
+
+        return ForAll(variable, predicate, quantifier.negate)
 
     @visitor(RelationInstance)
     def visit(self, relation: RelationInstance):
-        return relation
+        vars = [self.visit(var) for var in relation.vars]
+
+        return RelationInstance(relation.relation_name, *vars, negate=relation.negate)
 
     @visitor(FunctionInstance)
     def visit(self, function: FunctionInstance):
-        return function
+        arg = self.visit(function.arg)
+
+        return FunctionInstance(function.function_name, arg, function.negate)
+
+    def _scoped(self, quantifier):
+        variable = self.names.variable(quantifier.variable)
+        previous = self.scope.get(quantifier.variable)
+        self.scope[quantifier.variable] = variable
+        predicate = self.visit(quantifier.predicate)
+        if previous is None:
+            del self.scope[quantifier.variable]
+        else:
+            self.scope[quantifier.variable] = previous
+
+        return variable, predicate
 
 
 class CanonicalizeVisitor:
@@ -511,6 +645,9 @@ class SubstVisitor:
 
 class SkolemVisitor:
 
+    def __init__(self, names=None):
+        self.names = names or NameSupply()
+
     @visitor(Literal)
     def visit(self, literal):
         return literal
@@ -553,7 +690,7 @@ class SkolemVisitor:
 
     @visitor(ForAll)
     def visit(self, quantifier):
-        skolem_function_visitor = SkolemFunctionVisitor(quantifier.variable)
+        skolem_function_visitor = SkolemFunctionVisitor(quantifier.variable, self.names)
         predicate = skolem_function_visitor.visit(quantifier.predicate)
 
         if quantifier.negate:
@@ -575,10 +712,10 @@ class SkolemVisitor:
 
 
 class SkolemFunctionVisitor:
-    skolems = 0
 
-    def __init__(self, variable):
+    def __init__(self, variable, names=None):
         self.variable = variable
+        self.names = names or NameSupply()
 
     @visitor(Literal)
     def visit(self, literal):
@@ -614,8 +751,7 @@ class SkolemFunctionVisitor:
 
     @visitor(Exists)
     def visit(self, quantifier: Quantifier):
-        skolem = Function(f"skolem_{self.skolems}")
-        self.skolems += 1
+        skolem = Function(self.names.fresh("skolem"))
 
         subst_visitor = SubstVisitor(quantifier.variable, skolem(self.variable))
         new_predicate = subst_visitor.visit(quantifier.predicate)
@@ -626,7 +762,7 @@ class SkolemFunctionVisitor:
 
     @visitor(ForAll)
     def visit(self, quantifier):
-        skolem_function_visitor = SkolemFunctionVisitor(quantifier.variable)
+        skolem_function_visitor = SkolemFunctionVisitor(quantifier.variable, self.names)
         predicate = skolem_function_visitor.visit(quantifier.predicate)
 
         if quantifier.negate:
@@ -753,7 +889,32 @@ class DistributeVisitor:
         return FunctionInstance(function.function_name, arg, function.negate)
 
 
+def conjuncts(formula):
+    """Generator of the top-level conjuncts of a formula (or of a list of formulas), left to right.
+    Chains of `And` and free clauses are walked with an explicit stack, so they can be arbitrarily deep"""
+    todo = list(reversed(formula)) if type(formula) in [list, tuple] else [formula]
+
+    while todo:
+        term = todo.pop()
+
+        if type(term) is And and not term.negate:
+            todo += [term.operand2, term.operand1]
+        elif type(term) is FreeClause and not term.negate:
+            todo += reversed(term.terms)
+        else:
+            yield term
+
+
 class ClausifyVisitor:
+    """Clauses of a formula in CNF. `clauses` streams them one conjunct at a time (see `conjuncts`);
+    `visit` collects them in a `KB` (or returns a single `Clause` for a disjunction)"""
+
+    def clauses(self, formula):
+        for term in conjuncts(formula):
+            clause = self.visit(term)
+            # Check for naked Lit/Var needed because Clausify can't differentiate
+            # between literals/vars in Relation/Functions and free literals/vars
+            yield Clause({clause}) if type(clause) in [Literal, Var] else clause
 
     @visitor(Literal)
     def visit(self, literal):
@@ -765,21 +926,7 @@ class ClausifyVisitor:
 
     @visitor(And)
     def visit(self, operator: And):
-        new_kb = KB([])
-        op1 = self.visit(operator.operand1)
-        op2 = self.visit(operator.operand2)
-
-        # Check for naked Lit/Var needed because Clausify can't differentiate
-        # between literals/vars in Relation/Functions and free literals/vars
-        if type(op1) in [Literal, Var]:
-            op1 = Clause({op1})
-        if type(op2) in [Literal, Var]:
-            op2 = Clause({op2})
-
-        new_kb += op1
-        new_kb += op2
-
-        return new_kb
+        return KB.from_iterable(self.clauses(operator))
 
     @visitor(Or)
     def visit(self, operator: Operator):
@@ -791,14 +938,7 @@ class ClausifyVisitor:
 
     @visitor(FreeClause)
     def visit(self, clause: FreeClause):
-        terms = clause.terms
-        kb = KB()
-
-        new_terms = []
-        for term in terms:
-            kb += self.visit(term)
-
-        return kb
+        return KB.from_iterable(self.clauses(clause))
 
     @visitor(RelationInstance)
     def visit(self, relation: RelationInstance):
@@ -811,3 +951,258 @@ class ClausifyVisitor:
         arg = self.visit(function.arg)
 
         return Clause({FunctionInstance(function.function_name, arg, function.negate)})
+
+
+class NormalizeVisitor:
+    """Implication elimination, negation pushing, standardizing apart, Skolemization and free clause simplification
+    in a single traversal: the result is what `ImplicationsVisitor`, `CanonicalizeVisitor`, `GlobalizeVisitor`,
+    `SkolemVisitor` and `SimplifyVisitor` produce, up to the names of variables and Skolem functions.
+    Negations are pushed by visiting `~operand`; quantified variables and Skolem functions are named by `names`
+    (see `NameSupply`), where the free variables of the formula must be reserved first (see `NameSupply.reserve`)"""
+
+    def __init__(self, names=None):
+        self.names = names or NameSupply()
+        self.scope = {}
+        self.universal = None
+
+    @visitor(Literal)
+    def visit(self, literal):
+        return literal
+
+    @visitor(Var)
+    def visit(self, var):
+        return self.scope.get(var, var)
+
+    @visitor(And)
+    def visit(self, operator: And):
+        if operator.negate:
+            return Or(self.visit(~operator.operand1), self.visit(~operator.operand2))
+
+        return And(self.visit(operator.operand1), self.visit(operator.operand2))
+
+    @visitor(Or)
+    def visit(self, operator: Or):
+        if operator.negate:
+            return And(self.visit(~operator.operand1), self.visit(~operator.operand2))
+
+        return Or(self.visit(operator.operand1), self.visit(operator.operand2))
+
+    @visitor(Implies)
+    def visit(self, implication: Implies):
+        if implication.negate:
+            return And(self.visit(implication.operand1), self.visit(~implication.operand2))
+
+        return Or(self.visit(~implication.operand1), self.visit(implication.operand2))
+
+    @visitor(Iff)
+    def visit(self, iff: Iff):
+        op1, op2 = iff.operand1, iff.operand2
+        if iff.negate:
+            return Or(And(self.visit(op1), self.visit(~op2)), And(self.visit(~op1), self.visit(op2)))
+
+        return And(Or(self.visit(~op1), self.visit(op2)), Or(self.visit(~op2), self.visit(op1)))
+
+    @visitor(FreeClause)
+    def visit(self, clause: FreeClause):
+        if not clause.terms:
+            return clause
+        if clause.negate:
+            return Clause._make_or([self.visit(~term) for term in clause.terms])
+
+        return KB._make_and([self.visit(term) for term in clause.terms])
+
+    @visitor(Clause)
+    def visit(self, clause: Clause):
+        return self.visit(clause.to_free_clause())
+
+    @visitor(HornClause)
+    def visit(self, clause: HornClause):
+        return self.visit(clause.to_free_clause())
+
+    @visitor(Exists)
+    def visit(self, quantifier: Exists):
+        if quantifier.negate:
+            return self._universal(quantifier.variable, ~quantifier.predicate)
+
+        return self._existential(quantifier.variable, quantifier.predicate)
+
+    @visitor(ForAll)
+    def visit(self, quantifier: ForAll):
+        if quantifier.negate:
+            return self._existential(quantifier.variable, ~quantifier.predicate)
+
+        return self._universal(quantifier.variable, quantifier.predicate)
+
+    @visitor(RelationInstance)
+    def visit(self, relation: RelationInstance):
+        vars = [self.visit(var) for var in relation.vars]
+
+        return RelationInstance(relation.relation_name, *vars, negate=relation.negate)
+
+    @visitor(FunctionInstance)
+    def visit(self, function: FunctionInstance):
+        arg = self.visit(function.arg)
+
+        return FunctionInstance(function.function_name, arg, function.negate)
+
+    def _existential(self, variable, predicate):
+        if self.universal is None:
+            return self._scoped(variable, self.names.variable(variable), predicate)
+
+        skolem = Function(self.names.fresh("skolem"))
+
+        return self._scoped(variable, skolem(self.universal), predicate)
+
+    def _universal(self, variable, predicate):
+        renamed = self.names.variable(variable)
+        universal, self.universal = self.universal, renamed
+        result = self._scoped(variable, renamed, predicate)
+        self.universal = universal
+
+        return result
+
+    def _scoped(self, variable, value, predicate):
+        previous = self.scope.get(variable)
+        self.scope[variable] = value
+        result = self.visit(predicate)
+        if previous is None:
+            del self.scope[variable]
+        else:
+            self.scope[variable] = previous
+
+        return result
+
+
+class CNFVisitor:
+    """Clauses (as lists of sets of terms) of a quantifier-free formula in negation normal form, such as the output of
+    `NormalizeVisitor`: `DistributeVisitor` and `ClausifyVisitor` in a single traversal.
+    Relation and function arguments are left untouched"""
+
+    @visitor(Literal)
+    def visit(self, literal):
+        return [frozenset((literal,))]
+
+    @visitor(Var)
+    def visit(self, var):
+        return [frozenset((var,))]
+
+    @visitor(And)
+    def visit(self, operator: And):
+        return self.visit(operator.operand1) + self.visit(operator.operand2)
+
+    @visitor(Or)
+    def visit(self, operator: Or):
+        clauses1 = self.visit(operator.operand1)
+        clauses2 = self.visit(operator.operand2)
+
+        return [clause1 | clause2 for clause1 in clauses1 for clause2 in clauses2]
+
+    @visitor(FreeClause)
+    def visit(self, clause: FreeClause):
+        result = []
+        for term in clause.terms:
+            result += self.visit(term)
+
+        return result
+
+    @visitor(RelationInstance)
+    def visit(self, relation):
+        return [frozenset((relation,))]
+
+    @visitor(FunctionInstance)
+    def visit(self, function):
+        return [frozenset((function,))]
+
+
+def _operands(formula):
+    """Subformulas of a connective (none for an atom)"""
+    if type(formula) in [And, Or]:
+        return formula.operand1, formula.operand2
+    elif type(formula) is FreeClause:
+        return formula.terms
+
+    return ()
+
+
+class DefinitionsVisitor:
+    """Plaisted-Greenbaum clausification of a quantifier-free formula in negation normal form, such as the output of
+    `NormalizeVisitor`. Instead of distributing `Or` over `And`, each conjunction found under a disjunction is
+    replaced by a definition atom `definition#<n>(free vars...)`, and clauses `~definition#<n>(...) | conjunct` are
+    added for it. The result is equisatisfiable with the input and its size is linear in the size of the input.
+    `clauses` streams the clauses (as sets of terms); `visit` returns the terms of a disjunction"""
+
+    def __init__(self):
+        self.pending = deque()
+        # Free variables of the subformulas met so far, computed bottom-up (see `_free_vars`)
+        self.free_vars = {}
+
+    def clauses(self, formula):
+        """Generator of the clauses of `formula`, one conjunct at a time (see `conjuncts`)"""
+        self.pending.append((formula, None))
+        while self.pending:
+            formula, guard = self.pending.popleft()
+            for term in conjuncts(formula):
+                terms = self.visit(term)
+                yield frozenset(terms if guard is None else terms + [guard])
+
+        self.free_vars = {}
+
+    @visitor(Literal)
+    def visit(self, literal):
+        return [literal]
+
+    @visitor(Var)
+    def visit(self, var):
+        return [var]
+
+    @visitor(And)
+    def visit(self, operator: And):
+        free_vars = self._free_vars(operator)
+        name = NameSupply.symbol("definition")
+        atom = RelationInstance(name, *free_vars) if free_vars else Literal(name)
+        self.pending.append((operator, ~atom))
+
+        return [atom]
+
+    def _free_vars(self, formula):
+        """Free variables of `formula` in order of appearance. The conjunctions nested in it get definitions
+        of their own, so the variables of every subformula are kept, and each is only visited once"""
+        free_vars = self.free_vars
+        todo = [(formula, False)]
+
+        while todo:
+            term, expanded = todo.pop()
+            if term in free_vars:
+                continue
+
+            operands = _operands(term)
+            if expanded:
+                merged = {}
+                for operand in operands:
+                    merged.update(dict.fromkeys(free_vars[operand] if operand in free_vars
+                                                else FreeVarVisitor().visit(operand)))
+                free_vars[term] = tuple(merged)
+            else:
+                todo.append((term, True))
+                todo.extend((operand, False) for operand in operands if _operands(operand))
+
+        return free_vars[formula]
+
+    @visitor(Or)
+    def visit(self, operator: Or):
+        return self.visit(operator.operand1) + self.visit(operator.operand2)
+
+    @visitor(FreeClause)
+    def visit(self, clause: FreeClause):
+        if len(clause.terms) > 1:
+            return self.visit(KB._make_and(clause.terms))
+
+        return self.visit(clause.terms[0]) if clause.terms else []
+
+    @visitor(RelationInstance)
+    def visit(self, relation):
+        return [relation]
+
+    @visitor(FunctionInstance)
+    def visit(self, function):
+        return [function]